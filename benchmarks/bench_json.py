@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Per message decode cost of SNS envelopes with the standard library and the configured json_codec backend.
+
+Message sizes go up to the SNS limit of 256 KB.
+
+    PYTHONPATH=src python benchmarks/bench_json.py [--iterations N]
+"""
+import argparse
+import json
+
+from common import SIGNED_MESSAGE, bench
+
+from sns_monitor import json_codec
+
+__author__ = 'lundberg'
+
+# SNS messages can be at most 256 KB
+ENVELOPE_SIZES = [2 * 1024, 16 * 1024, 64 * 1024, 256 * 1024]
+
+
+def make_envelope(max_size: int) -> bytes:
+    """ An SNS envelope, at most max_size bytes, where Message is a JSON document as is common. """
+    items: list = []
+    envelope = json.dumps(SIGNED_MESSAGE).encode()
+    while True:
+        i = len(items)
+        items.append({'id': i, 'name': f'användare-{i}', 'enabled': i % 2 == 0, 'score': i / 3})
+        candidate = json.dumps(dict(SIGNED_MESSAGE, Message=json.dumps(items))).encode()
+        if len(candidate) > max_size:
+            return envelope
+        envelope = candidate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f'json_codec backend: {json_codec.backend}')
+    for size in ENVELOPE_SIZES:
+        body = make_envelope(size)
+        print(f'envelope size {len(body)} bytes')
+        bench('  json.loads', lambda: json.loads(body), args.iterations)
+        bench(f'  json_codec.loads ({json_codec.backend})', lambda: json_codec.loads(body), args.iterations)
+        message = json.loads(body)
+        bench('  json.dumps', lambda: json.dumps(message).encode(), args.iterations)
+        bench(f'  json_codec.dumps ({json_codec.backend})', lambda: json_codec.dumps(message), args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Load test of the complete app from init_sns_monitor_api with locally signed notifications.
+
+Notifications are signed with tests/data/test.key and the certificate is served by a local HTTP stand-in, so
+nothing leaves the host. Requests are sent in-process through the httpx ASGI transport by --concurrency clients.
+
+Two scenarios are run, each against a new app:
+
+    cold  every notification uses a new certificate URL so every request downloads and parses a certificate
+    warm  all notifications use the same, already cached, certificate
+
+    PYTHONPATH=src python benchmarks/bench_load.py [--requests N] [--concurrency N] [--config key=value ...]
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Sequence
+
+import httpx
+from common import DATA_DIR, SNS_HEADERS, LocalSigner
+
+from sns_monitor.api import init_sns_monitor_api
+
+__author__ = 'lundberg'
+
+
+class CertHandler(BaseHTTPRequestHandler):
+    cert = (DATA_DIR / 'test.crt').read_bytes()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-pem-file')
+        self.send_header('Content-Length', str(len(self.cert)))
+        self.end_headers()
+        self.wfile.write(self.cert)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CertServer(ThreadingHTTPServer):
+    """ Local stand-in for the SNS certificate host. """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), CertHandler)
+        self.base_url = f'http://127.0.0.1:{self.server_port}'
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+def percentile(timings: List[float], p: float) -> float:
+    return timings[max(0, int(len(timings) * p) - 1)]
+
+
+def report(name: str, timings: List[float], failures: int, elapsed: float) -> None:
+    timings = sorted(timings)
+    print(
+        f'{name:6} {len(timings):7} requests  {failures:5} failed  {len(timings) / elapsed:9.0f} requests/s  '
+        f'p50 {percentile(timings, 0.5) * 1e3:8.2f} ms  p99 {percentile(timings, 0.99) * 1e3:8.2f} ms'
+    )
+
+
+async def run_scenario(
+    name: str, config: Dict[str, Any], bodies: List[bytes], concurrency: int, warmup: Sequence[bytes] = ()
+) -> None:
+    app = init_sns_monitor_api(test_config=config)
+    await app.router.startup()
+    timings: List[float] = []
+    failures = 0
+    pending = iter(bodies)
+
+    async with httpx.AsyncClient(app=app, base_url='http://sns-monitor') as client:
+        for body in warmup:
+            await client.post('/messages/', content=body, headers=SNS_HEADERS)
+
+        async def worker() -> None:
+            nonlocal failures
+            for body in pending:
+                start = time.perf_counter()
+                response = await client.post('/messages/', content=body, headers=SNS_HEADERS)
+                timings.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    await app.router.shutdown()
+    report(name, timings, failures, elapsed)
+
+
+def parse_config(items: List[str]) -> Dict[str, Any]:
+    config: Dict[str, Any] = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        config[key] = value
+    return config
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--message-size', type=int, default=1024, help='size of the Message field in bytes')
+    parser.add_argument('--config', nargs='*', default=[], help='extra app configuration as key=value')
+    args = parser.parse_args()
+
+    cert_server = CertServer()
+    signer = LocalSigner()
+    config = {
+        'app_name': 'bench_load',
+        'log_level': 'WARNING',
+        'cert_url_regex': r'^http://127\.0\.0\.1:\d+/',
+        **parse_config(args.config),
+    }
+    print(f'{args.requests} requests, concurrency {args.concurrency}, config {config}')
+
+    message = 'x' * args.message_size
+    # Every notification has a unique MessageId so the verified message memo and deduplication never hit
+    cold = [
+        json.dumps(signer.notification(f'{cert_server.base_url}/cert-{i}.pem', message=message)).encode()
+        for i in range(args.requests)
+    ]
+    warm_cert_url = f'{cert_server.base_url}/cert.pem'
+    warm = [json.dumps(signer.notification(warm_cert_url, message=message)).encode() for _ in range(args.requests + 1)]
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run_scenario('cold', config, cold, args.concurrency))
+    # The first request caches the certificate before the measured requests
+    loop.run_until_complete(run_scenario('warm', config, warm[1:], args.concurrency, warmup=warm[:1]))
+    cert_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
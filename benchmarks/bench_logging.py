@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Log records per second, and formatTime calls per second, with and without cached timestamps in TimestampFormatter.
+
+    PYTHONPATH=src python benchmarks/bench_logging.py [--records N]
+"""
+import argparse
+import logging
+import os
+import time
+
+from sns_monitor.config import SNSMonitorConfig
+from sns_monitor.logging import AppFilter, TimestampFormatter
+
+__author__ = 'lundberg'
+
+
+def records_per_second(formatter: logging.Formatter, records: int) -> float:
+    with open(os.devnull, 'w') as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(formatter)
+        handler.addFilter(AppFilter(app_name='bench'))
+        logger = logging.Logger('bench')
+        logger.addHandler(handler)
+        start = time.perf_counter()
+        for i in range(records):
+            logger.info('Notification - Message ID: %s - Message: %s', i, 'test message')
+        return records / (time.perf_counter() - start)
+
+
+def format_time_per_second(formatter: logging.Formatter, records: int) -> float:
+    record = logging.LogRecord('bench', logging.INFO, __file__, 1, 'message', None, None)
+    start = time.perf_counter()
+    for _ in range(records):
+        formatter.formatTime(record)
+    return records / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    log_format = SNSMonitorConfig.__fields__['log_format'].default
+    for cached_timestamps in (False, True):
+        formatter = TimestampFormatter(fmt=log_format, cached_timestamps=cached_timestamps)
+        rate = records_per_second(formatter, args.records)
+        format_time_rate = format_time_per_second(formatter, args.records)
+        print(
+            f'cached_timestamps={cached_timestamps!s:5}  {rate:10.0f} records/s  '
+            f'{format_time_rate:10.0f} formatTime calls/s'
+        )
+
+
+if __name__ == '__main__':
+    main()
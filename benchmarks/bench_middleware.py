@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Compare the pure ASGI VerifySNSMessageSignature with the previous BaseHTTPMiddleware based implementation.
+
+    PYTHONPATH=src python benchmarks/bench_middleware.py [--iterations N]
+"""
+import argparse
+import json
+
+from common import SNS_HEADERS, bench_async, signed_body, warm_validator
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message
+
+from sns_monitor.message_validation import CachedSNSMessageValidator
+from sns_monitor.middleware import VerifySNSMessageSignature
+
+__author__ = 'lundberg'
+
+
+class LegacyVerifySNSMessageSignature(BaseHTTPMiddleware):
+    """ The BaseHTTPMiddleware implementation replaced by the pure ASGI middleware. """
+
+    def __init__(self, app: ASGIApp, message_validator: CachedSNSMessageValidator):
+        super().__init__(app)
+        self.message_validator = message_validator
+
+    @staticmethod
+    async def get_body(request: Request) -> bytes:
+        body = await request.body()
+
+        async def receive() -> Message:
+            return {'type': 'http.request', 'body': body}
+
+        request._receive = receive
+        return body
+
+    async def dispatch(self, request: Request, call_next):
+        if 'x-amz-sns-message-id' in request.headers:
+            body = json.loads(await self.get_body(request))
+            await self.message_validator.validate_message_async(message=body)
+        return await call_next(request)
+
+
+async def endpoint(request: Request) -> PlainTextResponse:
+    await request.body()
+    return PlainTextResponse('OK')
+
+
+def make_request(app: ASGIApp, body: bytes):
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': '/',
+        'raw_path': b'/',
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(k.encode(), v.encode()) for k, v in SNS_HEADERS.items()],
+        'client': ('127.0.0.1', 12345),
+        'server': ('127.0.0.1', 8080),
+    }
+
+    async def call() -> None:
+        sent = False
+
+        async def receive() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return {'type': 'http.disconnect'}
+
+        status = None
+
+        async def send(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await app(scope, receive, send)
+        assert status == 200, status
+
+    return call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    body = signed_body()
+    # No verified message memo, every request is verified
+    validator = warm_validator()
+    downstream = Starlette()
+    downstream.add_route('/', endpoint, methods=['POST'])
+
+    bench_async('no middleware', make_request(downstream, body), args.iterations)
+    bench_async(
+        'BaseHTTPMiddleware (previous)',
+        make_request(LegacyVerifySNSMessageSignature(downstream, message_validator=validator), body),
+        args.iterations,
+    )
+    bench_async(
+        'pure ASGI middleware',
+        make_request(VerifySNSMessageSignature(downstream, message_validator=validator), body),
+        args.iterations,
+    )
+
+
+if __name__ == '__main__':
+    main()
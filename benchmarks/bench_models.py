@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Construction cost of the SNSEnvelope used on the receive path compared to the full SNSMessage model.
+
+    PYTHONPATH=src python benchmarks/bench_models.py [--iterations N]
+"""
+import argparse
+
+from common import SIGNED_MESSAGE, bench
+
+from sns_monitor.models import SNSEnvelope, SNSMessage
+
+__author__ = 'lundberg'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    data = dict(SIGNED_MESSAGE)
+    bench('SNSMessage.parse_obj', lambda: SNSMessage.parse_obj(data), args.iterations)
+    bench('SNSEnvelope', lambda: SNSEnvelope(data), args.iterations)
+    bench('SNSEnvelope + model', lambda: SNSEnvelope(data).model, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the benchmark scripts in this directory.
+
+The benchmarks use the test certificate and the signed example message from the test suite so they can run
+without network access. Run them from the repository root, for example:
+
+    PYTHONPATH=src python benchmarks/bench_middleware.py
+"""
+import asyncio
+import base64
+import json
+import time
+import uuid
+from pathlib import Path
+from statistics import median
+from typing import Any, Awaitable, Callable, Dict, List
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from sns_message_validator.sns_message_validator import SNSMessageValidator
+
+from sns_monitor.message_validation import CachedSNSMessageValidator
+
+__author__ = 'lundberg'
+
+DATA_DIR = Path(__file__).parent.parent / 'src' / 'sns_monitor' / 'tests' / 'data'
+
+# Signed with tests/data/test.key, see tests/data/create_test_signature.py
+SIGNED_MESSAGE: Dict[str, Any] = {
+    'Type': 'Notification',
+    'MessageId': 'da41e39f-ea4d-435a-b922-c6aae3915ebe',
+    'TopicArn': 'arn:aws:sns:us-west-2:123456789012:MyTopic',
+    'Subject': 'test',
+    'Message': 'test message',
+    'Timestamp': '2012-04-25T21:49:25.719Z',
+    'SignatureVersion': '1',
+    'Signature': 'KsQfz4uV9wgpzkHWTzcG6RG1FbyZKk0pFm1hmJ76HCleXhARkLJkUyq4gD8vF19m9zVRz2K2zxlQlSVqyzsSUUYOY4NdvfTo66fJumHM7QxQ9nfWizVwno2qEnAYFnVIffHX4B3pPUp6ySogahNFMWnbayLL251tHaoCZC3sqGeF2vZk3VpGf0f/OuDOKtdPO94o7dlqrDE5kQtq7JEFPRogX0B4nRIBSzJm/0bY6VYElo8mu2pKRd2OnwSU9ZUEdFkWKjnN7mi4fmpZcEoJhHCyN9EFRG3qyh6yyP+X+3ZP9HJVJaJbdQxCbK19IwVjfsJ1mLtvsxoOu7dztdGWKw==',
+    'SigningCertURL': 'https://sns.us-west-2.amazonaws.com/SimpleNotificationService-f3ecfb7224c7233fe7bb5f59f96de52f.pem',
+    'UnsubscribeURL': 'https://sns.us-west-2.amazonaws.com/?Action=Unsubscribe&SubscriptionArn=arn:aws:sns:us-west-2:123456789012:MyTopic:2bcfbf39-05c3-41de-beaa-fcfcc21c8f55',
+}
+
+SNS_HEADERS = {
+    'x-amz-sns-message-type': 'Notification',
+    'x-amz-sns-message-id': SIGNED_MESSAGE['MessageId'],
+    'x-amz-sns-topic-arn': SIGNED_MESSAGE['TopicArn'],
+    'content-type': 'text/plain; charset=UTF-8',
+}
+
+
+def signed_body() -> bytes:
+    return json.dumps(SIGNED_MESSAGE).encode()
+
+
+class LocalSigner:
+    """ Signs synthetic SNS envelopes with tests/data/test.key, like tests/data/create_test_signature.py. """
+
+    def __init__(self, key_path: Path = DATA_DIR / 'test.key'):
+        self.key = serialization.load_pem_private_key(key_path.read_bytes(), password=None, backend=default_backend())
+        self.validator = SNSMessageValidator()
+
+    def sign(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        plain_text = self.validator._get_plaintext_to_sign(message).encode()
+        signature = self.key.sign(plain_text, PKCS1v15(), hashes.SHA1())
+        return dict(message, Signature=base64.b64encode(signature).decode())
+
+    def notification(self, cert_url: str, message: str = 'test message', **kwargs: Any) -> Dict[str, Any]:
+        """ A signed notification with a new MessageId. """
+        data = dict(SIGNED_MESSAGE, MessageId=str(uuid.uuid4()), Message=message, SigningCertURL=cert_url, **kwargs)
+        return self.sign(data)
+
+
+def warm_validator(**kwargs: Any) -> CachedSNSMessageValidator:
+    """ A validator with the test certificate already cached, so nothing is fetched during a benchmark. """
+    kwargs.setdefault('cert_cache_seconds', 3600)
+    validator = CachedSNSMessageValidator(**kwargs)
+    validator._cache_public_key(SIGNED_MESSAGE['SigningCertURL'], (DATA_DIR / 'test.crt').read_bytes())
+    return validator
+
+
+def report(name: str, timings: List[float]) -> None:
+    """ Print per call timings in microseconds. """
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(
+        f'{name:40} {len(timings):8} calls  median {median(timings) * 1e6:9.1f} us  '
+        f'p99 {p99 * 1e6:9.1f} us  {len(timings) / sum(timings):10.0f} calls/s'
+    )
+
+
+def bench(name: str, func: Callable[[], Any], iterations: int) -> None:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    report(name, timings)
+
+
+def bench_async(name: str, func: Callable[[], Awaitable[Any]], iterations: int) -> None:
+    async def run() -> List[float]:
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await func()
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    report(name, asyncio.get_event_loop().run_until_complete(run()))
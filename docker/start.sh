@@ -21,8 +21,12 @@ worker_threads=${worker_threads-1}
 # Need to tell Gunicorn to trust the X-Forwarded-* headers
 forwarded_allow_ips=${forwarded_allow_ips-'*'}
 
-mkdir -p "${log_dir}" "${state_dir}"
-chown -R eduid: "${log_dir}" "${state_dir}"
+# Shared by all workers for the Prometheus metrics, has to be emptied on every start
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR-"${state_dir}/prometheus"}
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+
+mkdir -p "${log_dir}" "${state_dir}" "${PROMETHEUS_MULTIPROC_DIR}"
+chown -R eduid: "${log_dir}" "${state_dir}" "${PROMETHEUS_MULTIPROC_DIR}"
 
 # set PYTHONPATH if it is not already set using Docker environment
 export PYTHONPATH=${PYTHONPATH-${project_dir}}
@@ -47,6 +51,7 @@ exec start-stop-daemon --start --quiet -c eduid:eduid --exec \
      /opt/eduid/bin/gunicorn \
      --pidfile "${state_dir}/${eduid_name}.pid" \
      --user=eduid --group=eduid -- \
+     --config python:sns_monitor.gunicorn_config \
      --bind 0.0.0.0:8080 \
      --workers ${workers} --worker-class ${worker_class} \
      --forwarded-allow-ips=${forwarded_allow_ips} \
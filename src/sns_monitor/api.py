@@ -1,14 +1,27 @@
 # -*- coding: utf-8 -*-
 import logging
+from functools import partial
 from typing import Any, Mapping, Optional
 
 from fastapi import FastAPI
 
-from sns_monitor.config import SNSMonitorConfig, load_config
-from sns_monitor.logging import init_logging
+from sns_monitor import json_codec
+from sns_monitor.config import HandlingMode, SNSMonitorConfig, load_config
+from sns_monitor.confirmer import SubscriptionConfirmer
+from sns_monitor.dedup import MessageDeduplicator
+from sns_monitor.dependencies import get_topic_allow_list
+from sns_monitor.handlers import HandlerRegistry
+from sns_monitor.logging import init_logging, stop_queue_logging
+from sns_monitor.message_validation import CachedSNSMessageValidator
 from sns_monitor.middleware import VerifySNSMessageSignature
-from sns_monitor.routers.messages import message_log_router
+from sns_monitor.models import MessageType
+from sns_monitor.routers.admin import admin_router
+from sns_monitor.routers.messages import handle_message, message_log_router, register_default_handlers
 from sns_monitor.routers.status import status_router
+from sns_monitor.sinks import MessageSink, SegmentedFileSink
+from sns_monitor.timing import RequestTimer
+from sns_monitor.topics import TopicAllowList
+from sns_monitor.workers import MessageWorkQueue
 
 __author__ = 'lundberg'
 
@@ -17,10 +30,87 @@ logger = logging.getLogger(__name__)
 
 class SNSMonitor(FastAPI):
     def __init__(self, config: SNSMonitorConfig):
-        super().__init__()
+        super().__init__(default_response_class=json_codec.response_class)
 
         self.state.config = config
         init_logging(self.state.config)
+        logger.debug(f'Using JSON backend {json_codec.backend}')
+        self.state.topic_allow_list = TopicAllowList(config.topic_allow_list)
+
+        self.state.message_validator = CachedSNSMessageValidator(
+            cert_cache_seconds=config.cert_cache_seconds,
+            cert_url_regex=config.cert_url_regex,
+            cert_fetch_timeout_seconds=config.cert_fetch_timeout_seconds,
+            cert_fetch_max_connections=config.cert_fetch_max_connections,
+            cert_fetch_failure_cache_seconds=config.cert_fetch_failure_cache_seconds,
+            cert_refresh_seconds=config.cert_refresh_seconds,
+            cert_cache_dir=config.cert_cache_dir,
+            verification_mode=config.signature_verification_mode,
+            verification_workers=config.signature_verification_workers,
+            verification_batch_size=config.signature_verification_batch_size,
+            verified_message_memo_size=config.verified_message_memo_size,
+            verified_message_memo_seconds=config.verified_message_memo_seconds,
+        )
+        self.add_event_handler('startup', self.state.message_validator.start)
+        self.add_event_handler('shutdown', self.state.message_validator.aclose)
+
+        # Add listeners for per request stage timings with app.state.request_timer.add_listener
+        self.state.request_timer = RequestTimer(server_timing_header=config.server_timing_header)
+
+        message_sink: Optional[MessageSink] = None
+        if config.message_store_dir is not None:
+            message_sink = SegmentedFileSink(
+                path=config.message_store_dir,
+                segment_max_bytes=config.message_store_segment_bytes,
+                fsync_batch_size=config.message_store_fsync_batch_size,
+                fsync_interval_seconds=config.message_store_fsync_interval_seconds,
+            )
+            self.add_event_handler('shutdown', message_sink.aclose)
+        self.state.message_sink = message_sink
+
+        # Add handlers with app.state.handler_registry.register
+        self.state.handler_registry = HandlerRegistry()
+        register_default_handlers(self.state.handler_registry)
+
+        subscription_confirmer: Optional[SubscriptionConfirmer] = None
+        if config.auto_confirm_subscriptions:
+            subscription_confirmer = SubscriptionConfirmer(
+                allow_list=partial(get_topic_allow_list, self),
+                subscribe_url_regex=config.subscribe_url_regex,
+                timeout_seconds=config.subscription_confirm_timeout_seconds,
+                retries=config.subscription_confirm_retries,
+                backoff_seconds=config.subscription_confirm_backoff_seconds,
+            )
+            self.state.handler_registry.register(
+                subscription_confirmer.handle, message_type=MessageType.SUBSCRIPTION_CONFIRMATION
+            )
+            self.add_event_handler('shutdown', subscription_confirmer.aclose)
+        self.state.subscription_confirmer = subscription_confirmer
+
+        message_deduplicator: Optional[MessageDeduplicator] = None
+        if config.message_dedup_capacity > 0:
+            message_deduplicator = MessageDeduplicator(
+                capacity=config.message_dedup_capacity,
+                error_rate=config.message_dedup_error_rate,
+                window_seconds=config.message_dedup_window_seconds,
+            )
+        self.state.message_deduplicator = message_deduplicator
+
+        message_work_queue: Optional[MessageWorkQueue] = None
+        if config.message_handling_mode is HandlingMode.background:
+            message_work_queue = MessageWorkQueue(
+                handler=partial(
+                    handle_message, registry=self.state.handler_registry, deduplicator=message_deduplicator
+                ),
+                max_size=config.message_queue_size,
+                workers=config.message_workers,
+                drain_seconds=config.message_queue_drain_seconds,
+            )
+            self.add_event_handler('shutdown', message_work_queue.aclose)
+        self.state.message_work_queue = message_work_queue
+
+        # Shutdown handlers run in order, stop queue logging last to get log records from the handlers above
+        self.add_event_handler('shutdown', stop_queue_logging)
 
 
 def init_sns_monitor_api(name: str = 'sns_monitor', test_config: Optional[Mapping[str, Any]] = None) -> SNSMonitor:
@@ -28,5 +118,10 @@ def init_sns_monitor_api(name: str = 'sns_monitor', test_config: Optional[Mappin
     app = SNSMonitor(config=config)
     app.include_router(message_log_router)
     app.include_router(status_router)
-    app.add_middleware(VerifySNSMessageSignature, cert_cache_seconds=config.cert_cache_seconds)
+    if config.admin_token:
+        app.include_router(admin_router)
+    app.add_middleware(
+        VerifySNSMessageSignature, message_validator=app.state.message_validator, request_timer=app.state.request_timer,
+    )
+    app.state.handler_registry.compile()
     return app
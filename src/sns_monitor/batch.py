@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Verify the signatures of SNS messages in bulk, for example when replaying archived notifications.
+
+Reads one JSON encoded SNS message per line, from files or stdin, and writes one JSON line per message with the
+result. The exit status is 1 if any message failed verification.
+
+    python -m sns_monitor.batch [--workers N] [--invalid-only] [FILE ...]
+"""
+import argparse
+import asyncio
+import fileinput
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, List, Optional
+
+from sns_monitor import json_codec
+from sns_monitor.message_validation import CachedSNSMessageValidator
+
+__author__ = 'lundberg'
+
+
+def read_messages(files: List[str]) -> Iterator[Any]:
+    """ Decoded JSON lines, None for lines that are not valid JSON. """
+    with fileinput.input(files=files or ['-'], mode='rb') as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield json_codec.loads(line)
+            except ValueError:
+                yield None
+
+
+async def verify(args: argparse.Namespace) -> int:
+    validator = CachedSNSMessageValidator(
+        cert_cache_seconds=args.cert_cache_seconds,
+        cert_url_regex=args.cert_url_regex,
+        cert_fetch_timeout_seconds=args.cert_fetch_timeout_seconds,
+    )
+    valid = invalid = 0
+    out = sys.stdout.buffer
+    try:
+        # Do not fork the running event loop and its threads
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            async for result in validator.validate_messages_async(
+                read_messages(args.files), executor=executor, batch_size=args.batch_size, chunk_size=args.chunk_size
+            ):
+                if result.valid:
+                    valid += 1
+                    if args.invalid_only:
+                        continue
+                else:
+                    invalid += 1
+                message_id = result.message.get('MessageId') if isinstance(result.message, dict) else None
+                line = {'index': result.index, 'message_id': message_id, 'valid': result.valid, 'error': result.error}
+                out.write(json_codec.dumps(line) + b'\n')
+    finally:
+        await validator.aclose()
+        out.flush()
+    print(f'{valid} valid, {invalid} invalid', file=sys.stderr)
+    return 1 if invalid else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='files with one SNS message per line, stdin if not given')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='verification processes')
+    parser.add_argument('--batch-size', type=int, default=10000, help='messages read and verified at a time')
+    parser.add_argument('--chunk-size', type=int, default=500, help='messages sent to a worker at a time')
+    parser.add_argument('--invalid-only', action='store_true', help='only output messages that failed verification')
+    parser.add_argument('--cert-url-regex', default=None, help='allowed certificate URLs')
+    parser.add_argument('--cert-cache-seconds', type=int, default=3600)
+    parser.add_argument('--cert-fetch-timeout-seconds', type=float, default=10.0)
+    args = parser.parse_args(argv)
+    return asyncio.run(verify(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
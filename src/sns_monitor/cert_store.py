@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import fcntl
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredCertificate:
+    pem: bytes
+    added: datetime
+
+
+class FileCertificateStore:
+    """
+    Certificate PEMs shared between all worker processes on a host.
+
+    Each SigningCertURL is stored as a file named by the sha256 of the url, the file modification time is the
+    time the certificate was fetched. Anyone able to write to this directory can make us accept forged messages
+    so it is created readable by the current user only, and an existing directory is only used if it is the same.
+
+    :raises PermissionError: If the directory is owned by another user or accessible by anyone else
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # The directory might already exist, possibly created by someone else in a world writable place like /dev/shm
+        st = self.path.stat()
+        if st.st_uid != os.geteuid() or st.st_mode & 0o077:
+            raise PermissionError(
+                f'Certificate store {self.path} has to be owned by uid {os.geteuid()} and accessible by the owner only'
+            )
+
+    def _pem_path(self, cert_url: str) -> Path:
+        return self.path / f'{sha256(cert_url.encode()).hexdigest()}.pem'
+
+    def get(self, cert_url: str) -> Optional[StoredCertificate]:
+        pem_path = self._pem_path(cert_url)
+        try:
+            with pem_path.open('rb') as f:
+                mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+                added = datetime.fromtimestamp(mtime_ns // 10 ** 9, tz=timezone.utc) + timedelta(
+                    microseconds=mtime_ns % 10 ** 9 // 1000
+                )
+                return StoredCertificate(pem=f.read(), added=added)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f'Could not read stored certificate for {cert_url}: {e}')
+            return None
+
+    def put(self, cert_url: str, pem: bytes, added: datetime) -> None:
+        pem_path = self._pem_path(cert_url)
+        try:
+            # Write to a temporary file and move it in place so readers never see a partial file
+            with NamedTemporaryFile(dir=self.path, prefix='.', suffix='.tmp', delete=False) as f:
+                f.write(pem)
+            # Use integer nanoseconds to get the exact same timestamp back in get
+            mtime_ns = int(added.replace(microsecond=0).timestamp()) * 10 ** 9 + added.microsecond * 1000
+            os.utime(f.name, ns=(mtime_ns, mtime_ns))
+            os.replace(f.name, pem_path)
+        except OSError as e:
+            logger.warning(f'Could not store certificate for {cert_url}: {e}')
+
+    def try_lock(self, cert_url: str) -> Optional[int]:
+        """
+        Try to take the fetch lock for a cert url without blocking.
+
+        :return: A file descriptor to pass to unlock or None if another process holds the lock
+        :raises OSError: If the lock file can not be opened
+        """
+        fd = os.open(f'{self._pem_path(cert_url)}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def unlock(fd: int) -> None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
@@ -21,6 +21,17 @@ class Environment(str, Enum):
     production = 'production'
 
 
+class VerificationMode(str, Enum):
+    inline = 'inline'
+    thread_pool = 'thread_pool'
+    process_pool = 'process_pool'
+
+
+class HandlingMode(str, Enum):
+    inline = 'inline'
+    background = 'background'
+
+
 class RootConfig(BaseSettings):
     app_name: str
     debug: bool = False
@@ -36,6 +47,14 @@ class LoggingFilters(str, Enum):
     SESSION_USER: str = 'user_filter'
 
 
+class LogQueueOverflow(str, Enum):
+    """ What to do with a log record when the log queue is full. """
+
+    drop_new = 'drop_new'
+    drop_old = 'drop_old'
+    block = 'block'
+
+
 class LoggingConfigMixin(BaseSettings):
     app_name: str
     testing: bool = False
@@ -46,12 +65,65 @@ class LoggingConfigMixin(BaseSettings):
     log_level: str = 'INFO'
     log_filters: List[str] = Field(default=['app_filter'])
     logging_config: dict = Field(default={})
+    log_cached_timestamps: bool = True
+    # Write JSON lines instead of using log_format
+    log_json: bool = False
+    # Hand log records to a background thread through a bounded queue instead of writing them in the request path
+    log_queue: bool = False
+    log_queue_size: int = 10000
+    log_queue_overflow: LogQueueOverflow = LogQueueOverflow.drop_new
 
 
 class SNSMonitorConfig(RootConfig, LoggingConfigMixin):
     environment: Environment = Environment.production
     cert_cache_seconds: int = 3600
+    # Only fetch certificates from URLs matching this regex, defaults to ^https://sns\.[-a-z0-9]+\.amazonaws\.com/
+    cert_url_regex: Optional[str] = None
+    cert_fetch_timeout_seconds: float = 10.0
+    cert_fetch_max_connections: int = 10
+    cert_fetch_failure_cache_seconds: int = 5
+    # Refresh cached certificates in the background this many seconds before they expire
+    cert_refresh_seconds: int = 300
+    # Share fetched certificates between all workers on the host, for example /dev/shm/sns_monitor_certs
+    cert_cache_dir: Optional[Path] = None
+    # Run RSA signature verification on the event loop or in a pool of signature_verification_workers threads or
+    # processes. With process_pool the signatures are sent to the pool at most signature_verification_batch_size at a
+    # time, the round trip makes it slower than inline unless there are spare cores.
+    signature_verification_mode: VerificationMode = VerificationMode.inline
+    signature_verification_workers: int = 4
+    signature_verification_batch_size: int = 100
+    # Remember this many verified messages to skip verifying redeliveries, 0 to disable
+    verified_message_memo_size: int = 10000
+    verified_message_memo_seconds: int = 3600
+    # Append all verified messages to a segmented message store in this directory
+    message_store_dir: Optional[Path] = None
+    message_store_segment_bytes: int = 64 * 1024 * 1024
+    message_store_fsync_batch_size: int = 100
+    message_store_fsync_interval_seconds: float = 1.0
+    # Acknowledge redelivered messages without handling them again. Disabled by default as the Bloom filter can
+    # mistake a new message for a redelivery, about message_dedup_error_rate of them, and never handle it. Enable by
+    # setting message_dedup_capacity to the number of messages expected in message_dedup_window_seconds, for
+    # example 1000000.
+    message_dedup_capacity: int = 0
+    message_dedup_error_rate: float = 1e-6
+    message_dedup_window_seconds: int = 3600
+    # Run handlers before acknowledging a message or acknowledge it when it is queued for message_workers workers
+    message_handling_mode: HandlingMode = HandlingMode.inline
+    message_queue_size: int = 1000
+    message_workers: int = 4
+    message_queue_drain_seconds: float = 10.0
     topic_allow_list: List[str] = []
+    # Return the time spent in each stage of receiving a message in a Server-Timing header
+    server_timing_header: bool = False
+    # Enable the /admin endpoints for requests with the header Authorization: Bearer <admin_token>
+    admin_token: Optional[str] = None
+    admin_profile_max_seconds: float = 60.0
+    # Call the SubscribeURL of subscription confirmations for topics in topic_allow_list
+    auto_confirm_subscriptions: bool = False
+    subscribe_url_regex: str = r'^https://sns\.[-a-z0-9]+\.amazonaws\.com/'
+    subscription_confirm_timeout_seconds: float = 10.0
+    subscription_confirm_retries: int = 5
+    subscription_confirm_backoff_seconds: float = 1.0
 
 
 def load_config(
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import re
+from typing import Callable, Optional, Set
+
+import httpx
+
+from sns_monitor.models import SNSEnvelope
+from sns_monitor.topics import TopicAllowList
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionConfirmer:
+    """
+    Confirms subscriptions by calling the SubscribeURL of SubscriptionConfirmation messages.
+
+    Only subscriptions to topics in the topic allow list are confirmed, an empty allow list confirms nothing as anyone
+    can subscribe the endpoint to their topic. Confirmation runs in a background task, outside of the request, and
+    is retried with exponential backoff on connection errors and server errors.
+    """
+
+    def __init__(
+        self,
+        allow_list: Callable[[], TopicAllowList],
+        subscribe_url_regex: str = r'^https://sns\.[-a-z0-9]+\.amazonaws\.com/',
+        timeout_seconds: float = 10.0,
+        max_connections: int = 10,
+        retries: int = 5,
+        backoff_seconds: float = 1.0,
+    ):
+        self.allow_list = allow_list
+        self.subscribe_url_regex = re.compile(subscribe_url_regex)
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # Created on first use so that the client is bound to the running event loop
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._http_client
+
+    async def aclose(self) -> None:
+        """ Cancel unfinished confirmations and close the pooled HTTP client, should be called on shutdown. """
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def handle(self, message: SNSEnvelope) -> None:
+        """ Message handler starting confirmation of allowed subscriptions. """
+        subscribe_url = message.subscribe_url
+        if message.topic_arn not in self.allow_list():
+            logger.info(f'Not confirming subscription to topic {message.topic_arn}, topic not in allow list')
+            return None
+        if subscribe_url is None or not self.subscribe_url_regex.match(subscribe_url):
+            logger.error(f'Not confirming subscription to topic {message.topic_arn}, invalid SubscribeURL')
+            return None
+        task = asyncio.ensure_future(self.confirm(topic_arn=message.topic_arn, subscribe_url=subscribe_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def confirm(self, topic_arn: str, subscribe_url: str) -> bool:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            try:
+                resp = await self.http_client.get(subscribe_url)
+                resp.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code < 500:
+                    # The token is invalid or has expired, retrying will not help
+                    logger.error(f'Failed to confirm subscription to topic {topic_arn}: {e}')
+                    return False
+                logger.warning(f'Failed to confirm subscription to topic {topic_arn} (attempt {attempt + 1}): {e}')
+            except httpx.HTTPError as e:
+                logger.warning(f'Failed to confirm subscription to topic {topic_arn} (attempt {attempt + 1}): {e}')
+            else:
+                logger.info(f'Confirmed subscription to topic {topic_arn}')
+                return True
+        logger.error(f'Giving up confirming subscription to topic {topic_arn}')
+        return False
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+from hashlib import blake2b
+from typing import Iterator
+
+__author__ = 'lundberg'
+
+
+class BloomFilter:
+    """ Fixed size Bloom filter sized for capacity items at the given false positive rate. """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing, k positions from two 64 bit hashes
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.size
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for pos in self._positions(item):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+class MessageDeduplicator:
+    """
+    Time windowed set of seen message ids backed by two rotating Bloom filters.
+
+    New ids are added to the current filter and lookups check both the current and the previous filter. The current
+    filter is rotated out when it is window_seconds old or holds capacity ids, so an id is remembered for at least
+    window_seconds (unless more than capacity ids are seen in that time) and at most twice that. Memory use is fixed
+    at two filters regardless of message rate.
+
+    A false positive, at most about twice error_rate, acknowledges a message that was never handled.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, window_seconds: int):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window_seconds = window_seconds
+        self.duplicates = 0
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotate_at = time.monotonic() + window_seconds
+
+    def _maybe_rotate(self) -> None:
+        now = time.monotonic()
+        if now >= self._rotate_at or self._current.count >= self.capacity:
+            if now >= self._rotate_at + self.window_seconds:
+                # Nothing has been added for more than a full window, forget everything
+                self._previous = BloomFilter(self.capacity, self.error_rate)
+            else:
+                self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+            self._rotate_at = now + self.window_seconds
+
+    def seen(self, message_id: str) -> bool:
+        self._maybe_rotate()
+        if message_id in self._current or message_id in self._previous:
+            self.duplicates += 1
+            return True
+        return False
+
+    def add(self, message_id: str) -> None:
+        self._maybe_rotate()
+        self._current.add(message_id)
@@ -2,21 +2,54 @@
 
 import logging
 
-from fastapi import Header, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Request
 
-from sns_monitor.models import MessageType
+from sns_monitor.models import MessageType, SNSEnvelope
+from sns_monitor.topics import TopicAllowList
 
 __author__ = 'lundberg'
 
 logger = logging.getLogger(__name__)
 
 
+def get_topic_allow_list(app: FastAPI) -> TopicAllowList:
+    """
+    Return the compiled topic allow list.
+
+    The list is compiled again if config.topic_allow_list has been replaced, so assign a new list to change the allowed
+    topics at runtime.
+    """
+    topic_arns = app.state.config.topic_allow_list
+    allow_list = app.state.topic_allow_list
+    if allow_list.topic_arns is not topic_arns:
+        allow_list = TopicAllowList(topic_arns)
+        app.state.topic_allow_list = allow_list
+    return allow_list
+
+
 async def verify_topic(
     request: Request, x_amz_sns_topic_arn: str = Header(...), x_amz_sns_message_type: str = Header(...)
 ):
+    # Prefer the signed values of a verified message over the headers
+    message = getattr(request.state, 'sns_message', None)
+    if message is not None:
+        topic_arn, message_type = message.topic_arn, message.type.value
+    else:
+        topic_arn, message_type = x_amz_sns_topic_arn, x_amz_sns_message_type
     # Only check if the topic is allowed if it is a notification as we probably want to receive subscription and
     # unsubscription events
-    if MessageType(x_amz_sns_message_type) is MessageType.NOTIFICATION and request.app.state.config.topic_allow_list:
-        if x_amz_sns_topic_arn not in request.app.state.config.topic_allow_list:
-            logger.info(f'Notification from topic {x_amz_sns_topic_arn} rejected')
-            raise HTTPException(status_code=400, detail=f"Notifications from topic {x_amz_sns_topic_arn} not allowed")
+    if message_type == MessageType.NOTIFICATION.value:
+        allow_list = get_topic_allow_list(request.app)
+        if allow_list and topic_arn not in allow_list:
+            logger.info(f'Notification from topic {topic_arn} rejected')
+            raise HTTPException(status_code=400, detail=f"Notifications from topic {topic_arn} not allowed")
+
+
+async def get_sns_message(request: Request) -> SNSEnvelope:
+    """ Return the message parsed and verified by the VerifySNSMessageSignature middleware. """
+    message = getattr(request.state, 'sns_message', None)
+    if message is None:
+        # The middleware only verifies requests with the x-amz-sns-message-id header
+        logger.error('Received message without verified signature')
+        raise HTTPException(status_code=422, detail="Unprocessable Entity")
+    return message
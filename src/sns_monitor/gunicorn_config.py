@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn server hooks, used with gunicorn --config python:sns_monitor.gunicorn_config
+"""
+import os
+
+from prometheus_client import multiprocess
+
+__author__ = 'lundberg'
+
+
+def child_exit(server, worker):
+    # Remove the live gauges of the dead worker from the multiprocess metrics, counters and histograms are kept
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+from fnmatch import translate
+from typing import Awaitable, Callable, Dict, List, Optional, Pattern, Tuple
+
+from sns_monitor.models import MessageType, SNSEnvelope
+from sns_monitor.topics import is_pattern
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[SNSEnvelope], Awaitable[None]]
+
+
+class HandlerRegistry:
+    """
+    Message handlers registered per topic ARN and message type.
+
+    Topic ARNs can use shell style wildcards, for example arn:aws:sns:*:123456789012:*, and a message type of None
+    matches all message types. All handlers matching a message are run in the order they were registered.
+
+    Registrations are compiled into a dispatch table keyed by (topic ARN, message type). Registrations without
+    wildcards go straight into the table and topics matching a wildcard are added the first time they are seen, so
+    dispatch is a single dict lookup however many topics are registered.
+    """
+
+    def __init__(self, max_dispatch_size: int = 10000):
+        self.max_dispatch_size = max_dispatch_size
+        self._registrations: List[Tuple[str, Optional[MessageType], MessageHandler]] = []
+        self._patterns: List[Tuple[Pattern, Optional[MessageType], MessageHandler]] = []
+        self._dispatch: Dict[Tuple[str, MessageType], Tuple[MessageHandler, ...]] = {}
+        self._compiled = False
+
+    def register(
+        self, handler: MessageHandler, topic_arn: str = '*', message_type: Optional[MessageType] = None
+    ) -> MessageHandler:
+        self._registrations.append((topic_arn, message_type, handler))
+        self._compiled = False
+        return handler
+
+    def handler(
+        self, topic_arn: str = '*', message_type: Optional[MessageType] = None
+    ) -> Callable[[MessageHandler], MessageHandler]:
+        """ Decorator version of register. """
+
+        def decorator(handler: MessageHandler) -> MessageHandler:
+            return self.register(handler, topic_arn=topic_arn, message_type=message_type)
+
+        return decorator
+
+    def compile(self) -> None:
+        self._patterns = [
+            (re.compile(translate(topic_arn)), message_type, handler)
+            for topic_arn, message_type, handler in self._registrations
+        ]
+        self._dispatch = {}
+        # Topics registered without wildcards are known up front
+        for topic_arn, _, _ in self._registrations:
+            if not is_pattern(topic_arn):
+                for message_type in MessageType:
+                    self._dispatch[(topic_arn, message_type)] = self._resolve(topic_arn, message_type)
+        self._compiled = True
+
+    def _resolve(self, topic_arn: str, message_type: MessageType) -> Tuple[MessageHandler, ...]:
+        return tuple(
+            handler
+            for pattern, handler_message_type, handler in self._patterns
+            if (handler_message_type is None or handler_message_type is message_type) and pattern.match(topic_arn)
+        )
+
+    def get_handlers(self, topic_arn: str, message_type: MessageType) -> Tuple[MessageHandler, ...]:
+        if not self._compiled:
+            self.compile()
+        key = (topic_arn, message_type)
+        handlers = self._dispatch.get(key)
+        if handlers is None:
+            handlers = self._resolve(topic_arn, message_type)
+            if len(self._dispatch) >= self.max_dispatch_size:
+                # Do not let an unbounded number of topics grow the table, start over
+                self.compile()
+            self._dispatch[key] = handlers
+        return handlers
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+JSON encoding and decoding using orjson when it is installed, falling back to the standard library.
+
+Decode errors are ValueErrors with both backends (orjson.JSONDecodeError is a json.JSONDecodeError).
+"""
+import json
+from typing import Any, Type, Union
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+__author__ = 'lundberg'
+
+
+if orjson is not None:
+    backend = 'orjson'
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    response_class: Type[JSONResponse] = ORJSONResponse
+
+else:  # pragma: no cover
+    backend = 'json'
+
+    def loads(data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    response_class = JSONResponse
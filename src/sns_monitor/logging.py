@@ -2,16 +2,20 @@
 
 from __future__ import annotations
 
+import copy
 import logging
 import logging.config
+import queue
 import time
+from logging.handlers import QueueHandler, QueueListener
 from os import environ
 from pprint import pformat
-from typing import TYPE_CHECKING, Any, Dict, Sequence
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
 
 from pydantic import BaseModel, Field
 
-from sns_monitor.config import LoggingConfigMixin, LoggingFilters
+from sns_monitor import json_codec
+from sns_monitor.config import LoggingConfigMixin, LoggingFilters, LogQueueOverflow
 
 # From https://stackoverflow.com/a/39757388
 # The TYPE_CHECKING constant is always False at runtime, so the import won't be evaluated, but mypy
@@ -34,9 +38,21 @@ DEFAULT_FORMAT = '{asctime} | {levelname:7} | {hostname} | {eppn:11} | {name:35}
 
 # Default to RFC3339/ISO 8601 with tz
 class TimestampFormatter(logging.Formatter):
-    def __init__(self, relative_time: bool = False, fmt=None):
+    def __init__(self, relative_time: bool = False, fmt=None, cached_timestamps: bool = False):
         super().__init__(fmt=fmt, style='{')
         self._relative_time = relative_time
+        # Most log records under load share the same second, only format the second and timezone once
+        self._cached_timestamps = cached_timestamps
+        self._cached_second: Tuple[int, str, str] = (-1, '', '')
+
+    def _format_second(self, created: float) -> Tuple[str, str]:
+        # self.converter seems incorrectly typed as a two-argument method (Callable[[Optional[float]], struct_time])
+        ct = self.converter(created)  # type: ignore
+        t = time.strftime('%Y-%m-%dT%H:%M:%S', ct)
+        tz = time.strftime('%z', ct)  # Can evaluate to empty string
+        if tz:
+            tz = '{0}:{1}'.format(tz[:3], tz[3:])  # Need colon to follow the rfc/iso
+        return t, tz
 
     def formatTime(self, record: logging.LogRecord, datefmt=None) -> str:
         if self._relative_time:
@@ -44,17 +60,50 @@ class TimestampFormatter(logging.Formatter):
             _seconds = record.relativeCreated / 1000
             return f'{_seconds:.3f}s'
 
-        # self.converter seems incorrectly typed as a two-argument method (Callable[[Optional[float]], struct_time])
-        ct = self.converter(record.created)  # type: ignore
         if datefmt:
-            s = time.strftime(datefmt, ct)
+            # self.converter seems incorrectly typed as a two-argument method (Callable[[Optional[float]], struct_time])
+            return time.strftime(datefmt, self.converter(record.created))  # type: ignore
+
+        if self._cached_timestamps:
+            second = int(record.created)
+            # Read and replace the cache as one tuple as records can be formatted from several threads
+            cached_second, t, tz = self._cached_second
+            if cached_second != second:
+                t, tz = self._format_second(record.created)
+                self._cached_second = (second, t, tz)
+        else:
+            t, tz = self._format_second(record.created)
+        return '{}.{:03.0f}{}'.format(t, record.msecs, tz)
+
+
+class JSONFormatter(TimestampFormatter):
+    """
+    Format log records as one JSON object per line.
+
+    Fields added by AppFilter are included when present. Records logged with extra={'sns_message': {...}} get the
+    SNS message fields as top level keys instead of the free text message.
+    """
+
+    app_fields = ('app_name', 'hostname', 'system_hostname')
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'name': record.name,
+            'module': record.module,
+        }
+        for field in self.app_fields:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        sns_message = getattr(record, 'sns_message', None)
+        if sns_message is not None:
+            data.update(sns_message)
         else:
-            t = time.strftime('%Y-%m-%dT%H:%M:%S', ct)
-            tz = time.strftime('%z', ct)  # Can evaluate to empty string
-            if tz:
-                tz = '{0}:{1}'.format(tz[:3], tz[3:])  # Need colon to follow the rfc/iso
-            s = '{}.{:03.0f}{}'.format(t, record.msecs, tz)
-        return s
+            data['message'] = record.getMessage()
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json_codec.dumps(data).decode()
 
 
 class AppFilter(logging.Filter):
@@ -126,6 +175,96 @@ class RequireDebugFalse(logging.Filter):
         return not self.app_debug
 
 
+class BoundedQueueHandler(QueueHandler):
+    """
+    Put log records on a bounded queue to be emitted by a QueueListener in a background thread.
+
+    When the queue is full records are dropped, or the caller blocks, according to the overflow policy.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: LogQueueOverflow = LogQueueOverflow.drop_new):
+        super().__init__(log_queue)
+        # QueueHandler.queue is only typed as something with put_nowait
+        self._queue: queue.Queue = log_queue
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge the message arguments in to the message like QueueHandler.prepare, but keep the exception for the
+        formatters of the handlers behind the queue instead of formatting the traceback in to the message.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow is LogQueueOverflow.block:
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+            return
+        except queue.Full:
+            if self.overflow is LogQueueOverflow.drop_new:
+                self.dropped += 1
+                return
+        # Make room by dropping the oldest record
+        try:
+            self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.dropped += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_listener: Optional[QueueListener] = None
+_queue_handler: Optional[BoundedQueueHandler] = None
+# The root logger handlers moved behind the queue
+_replaced_handlers: List[logging.Handler] = []
+
+
+def start_queue_logging(size: int, overflow: LogQueueOverflow) -> BoundedQueueHandler:
+    """ Move the root logger handlers behind a bounded queue that is emptied by a background thread. """
+    global _queue_listener, _queue_handler, _replaced_handlers
+    stop_queue_logging()
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue: queue.Queue = queue.Queue(maxsize=size)
+    queue_handler = BoundedQueueHandler(log_queue, overflow=overflow)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    _queue_handler = queue_handler
+    _replaced_handlers = handlers
+
+    _queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+    return queue_handler
+
+
+def stop_queue_logging() -> None:
+    """ Emit all queued log records, stop the background thread and give the root logger its handlers back. """
+    global _queue_listener, _queue_handler, _replaced_handlers
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+    if _queue_handler is not None:
+        # Records logged after this would otherwise end up in a queue that nobody empties
+        root = logging.getLogger()
+        root.removeHandler(_queue_handler)
+        for handler in _replaced_handlers:
+            root.addHandler(handler)
+        _queue_handler = None
+        _replaced_handlers = []
+
+
 def merge_config(base_config: Dict[str, Any], new_config: Dict[str, Any]) -> Dict[str, Any]:
     """ Recursively merge two dictConfig dicts. """
 
@@ -152,13 +291,20 @@ def init_logging(config: LoggingConfigMixin) -> None:
     See `make_local_context` for how to configure logging.
 
     Merges optional dictConfig from settings before initializing (config key 'logging_config').
+
+    If config.log_queue is set the configured handlers are run by a background thread, see start_queue_logging.
     """
+    # Flush and stop any previous queue listener before its handlers are replaced
+    stop_queue_logging()
+
     local_context = make_local_context(config)
     logging_config = make_dictConfig(local_context)
 
     logging_config = merge_config(logging_config, config.logging_config)
 
     logging.config.dictConfig(logging_config)
+    if config.log_queue:
+        start_queue_logging(size=config.log_queue_size, overflow=config.log_queue_overflow)
     if config.debug:
         logging.debug(f'Logging config:\n{pformat(logging_config)}')
     logging.info('Logging configured')
@@ -174,6 +320,8 @@ class LocalContext(BaseModel):
     debug_eppns: Sequence[str] = []
     filters: Sequence[LoggingFilters] = []  # filters to activate
     relative_time: bool = False  # use relative time as {asctime}
+    cached_timestamps: bool = False  # format the date and time part of {asctime} once per second
+    json_output: bool = False  # write log records as JSON lines instead of using format
 
 
 def make_local_context(config: LoggingConfigMixin) -> LocalContext:
@@ -202,6 +350,8 @@ def make_local_context(config: LoggingConfigMixin) -> LocalContext:
             debug_eppns=config.debug_eppns,
             filters=config.log_filters,
             relative_time=relative_time,
+            cached_timestamps=config.log_cached_timestamps,
+            json_output=config.log_json,
         )
     except (KeyError, AttributeError) as e:
         raise Exception(f'Could not initialize logging local_context. {type(e).__name__}: {e}')
@@ -253,6 +403,12 @@ def make_dictConfig(local_context: LocalContext) -> Dict[str, Any]:
                 '()': 'sns_monitor.logging.TimestampFormatter',
                 'relative_time': 'cfg://local_context.relative_time',
                 'fmt': 'cfg://local_context.format',
+                'cached_timestamps': 'cfg://local_context.cached_timestamps',
+            },
+            'json': {
+                '()': 'sns_monitor.logging.JSONFormatter',
+                'relative_time': 'cfg://local_context.relative_time',
+                'cached_timestamps': 'cfg://local_context.cached_timestamps',
             },
         },
         # Filters
@@ -262,7 +418,7 @@ def make_dictConfig(local_context: LocalContext) -> Dict[str, Any]:
             'console': {
                 'class': 'logging.StreamHandler',
                 'level': 'cfg://local_context.level',
-                'formatter': 'default',
+                'formatter': 'json' if local_context.json_output else 'default',
                 'filters': local_context.filters,
             },
         },
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import base64
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from functools import partial
+from hashlib import blake2b
+from itertools import islice
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
 
+import httpx
 import requests
 from cryptography.exceptions import InvalidSignature
 from cryptography.hazmat.backends import default_backend
@@ -11,20 +22,201 @@ from cryptography.hazmat.backends.openssl.rsa import _RSAPublicKey
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
 from cryptography.hazmat.primitives.hashes import SHA1
 from cryptography.x509 import Certificate, load_pem_x509_certificate
-from sns_message_validator import SignatureVerificationFailureException
+from sns_message_validator import (
+    InvalidCertURLException,
+    InvalidMessageTypeException,
+    InvalidSignatureVersionException,
+    SignatureVerificationFailureException,
+)
 from sns_message_validator.sns_message_validator import SNSMessageValidator
 
+from sns_monitor.cert_store import FileCertificateStore
+from sns_monitor.config import VerificationMode
+from sns_monitor.metrics import (
+    CERT_CACHE_FAILURE,
+    CERT_CACHE_HIT,
+    CERT_CACHE_MISS,
+    CERT_FETCH_SECONDS,
+    SIGNATURE_VERIFICATION_SECONDS,
+    VERIFIED_MESSAGE_MEMO_HIT,
+    VERIFIED_MESSAGE_MEMO_MISS,
+)
+from sns_monitor.timing import NULL_TIMINGS, RequestTimings
 from sns_monitor.utils import utc_now
 
 __author__ = 'lundberg'
 
+logger = logging.getLogger(__name__)
+
+
+def load_public_key(pem: bytes) -> _RSAPublicKey:
+    cert: Certificate = load_pem_x509_certificate(pem, default_backend())
+    # Explicitly type public_key to please mypy
+    public_key: _RSAPublicKey = cert.public_key()
+    return public_key
+
+
+def public_key_id(pem: bytes) -> bytes:
+    """ Short id of a certificate, sent to the verification pool processes instead of the whole certificate. """
+    return blake2b(pem, digest_size=16).digest()
+
+
+# Public keys parsed in this process, by key id, used by the functions below that run in verification pool processes
+_worker_public_keys: Dict[bytes, _RSAPublicKey] = {}
+_worker_public_keys_max_size = 100
+
+
+def _get_worker_public_key(pem: bytes) -> _RSAPublicKey:
+    key_id = public_key_id(pem)
+    public_key = _worker_public_keys.get(key_id)
+    if public_key is None:
+        if len(_worker_public_keys) >= _worker_public_keys_max_size:
+            _worker_public_keys.clear()
+        public_key = _worker_public_keys[key_id] = load_public_key(pem)
+    return public_key
+
+
+def _verify_signed_data(public_key: _RSAPublicKey, signed_data: Sequence[Tuple[bytes, bytes]]) -> List[Optional[str]]:
+    errors: List[Optional[str]] = []
+    for plaintext, signature in signed_data:
+        try:
+            public_key.verify(signature=signature, data=plaintext, algorithm=SHA1(), padding=PKCS1v15())
+            errors.append(None)
+        except InvalidSignature:
+            errors.append('Invalid signature.')
+    return errors
+
+
+def verify_signatures(pem: bytes, signed_data: Sequence[Tuple[bytes, bytes]]) -> List[Optional[str]]:
+    """
+    Verify (plaintext, signature) pairs signed with the public key in a PEM encoded certificate, returns an error
+    message for every invalid signature.
+
+    Only takes picklable arguments so that it can run in a ProcessPoolExecutor. The parsed public key is kept in the
+    worker process for the next messages signed with the same certificate.
+    """
+    return _verify_signed_data(_get_worker_public_key(pem), signed_data)
+
+
+def verify_signatures_with_key_id(
+    key_id: bytes, signed_data: Sequence[Tuple[bytes, bytes]]
+) -> Optional[List[Optional[str]]]:
+    """ Same as verify_signatures for a certificate already used in this process, returns None if it was not. """
+    public_key = _worker_public_keys.get(key_id)
+    if public_key is None:
+        return None
+    return _verify_signed_data(public_key, signed_data)
+
+
+def _start_worker() -> None:
+    # Run in the verification pool at startup, the work is importing this module in a new process
+    pass
+
 
 @dataclass
-class CachedCertificate:
-    cert: Certificate
+class CachedPublicKey:
+    public_key: _RSAPublicKey
+    pem: bytes
+    key_id: bytes
     added: datetime
 
 
+@dataclass
+class PendingVerification:
+    plaintext: bytes
+    signature: bytes
+    future: asyncio.Future
+
+
+@dataclass
+class BatchVerificationResult:
+    # Position of the message in the input
+    index: int
+    message: Any
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class CachedFetchFailure:
+    reason: str
+    added: datetime
+
+
+class VerifiedMessageMemo:
+    """
+    Bounded LRU of recently verified messages, used to skip verification of SNS redeliveries and fan-out copies.
+
+    Entries are keyed by MessageId and a digest of the Signature. As the signature alone does not bind the rest of
+    the message a hit also requires the signed fields to be unchanged, that is checked using a digest of their values.
+    """
+
+    # Superset of the fields used by _get_plaintext_to_sign for all message types
+    signed_fields = (
+        'Type',
+        'MessageId',
+        'TopicArn',
+        'Subject',
+        'Message',
+        'Timestamp',
+        'SubscribeURL',
+        'Token',
+        'SignatureVersion',
+        'SigningCertURL',
+    )
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # (MessageId, signature digest) -> (expires, signed fields digest)
+        self._entries: 'OrderedDict[Tuple[str, bytes], Tuple[float, bytes]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(message: Dict[str, Any]) -> Tuple[str, bytes]:
+        signature = message.get('Signature') or ''
+        return str(message.get('MessageId')), blake2b(signature.encode(), digest_size=16).digest()
+
+    def _content_digest(self, message: Dict[str, Any]) -> bytes:
+        h = blake2b(digest_size=16)
+        for field in self.signed_fields:
+            value = message.get(field)
+            data = b'' if value is None else str(value).encode()
+            # Length prefix and None marker to make the digest unambiguous
+            h.update(b'\x00' if value is None else b'\x01')
+            h.update(len(data).to_bytes(8, 'big'))
+            h.update(data)
+        return h.digest()
+
+    def contains(self, message: Dict[str, Any]) -> bool:
+        key = self._key(message)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, content_digest = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+            elif content_digest == self._content_digest(message):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+        self.misses += 1
+        return False
+
+    def add(self, message: Dict[str, Any]) -> None:
+        key = self._key(message)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, self._content_digest(message))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
 # We should see if it is possible to validate the cert using a Amazon root cert
 # but not even Amazon seems to do that.
 # https://docs.aws.amazon.com/sns/latest/dg/sns-example-code-endpoint-java-servlet.html
@@ -38,7 +230,20 @@ class CachedCertificate:
 
 class CachedSNSMessageValidator(SNSMessageValidator):
     def __init__(
-        self, cert_cache_seconds: int, cert_url_regex: Optional[str] = None, signature_version: Optional[str] = None
+        self,
+        cert_cache_seconds: int,
+        cert_url_regex: Optional[str] = None,
+        signature_version: Optional[str] = None,
+        cert_fetch_timeout_seconds: float = 10.0,
+        cert_fetch_max_connections: int = 10,
+        cert_fetch_failure_cache_seconds: int = 5,
+        cert_refresh_seconds: int = 300,
+        cert_cache_dir: Optional[Path] = None,
+        verification_mode: VerificationMode = VerificationMode.inline,
+        verification_workers: int = 4,
+        verification_batch_size: int = 100,
+        verified_message_memo_size: int = 0,
+        verified_message_memo_seconds: int = 3600,
     ):
         kwargs = {}
         if cert_url_regex:
@@ -47,41 +252,394 @@ class CachedSNSMessageValidator(SNSMessageValidator):
             kwargs['signature_version'] = signature_version
         super().__init__(**kwargs)
         self.cert_cache_seconds = cert_cache_seconds
-        self.cached_certificates: Dict[str, CachedCertificate] = {}
+        self.cert_fetch_timeout_seconds = cert_fetch_timeout_seconds
+        self.cert_fetch_max_connections = cert_fetch_max_connections
+        self.cert_fetch_failure_cache_seconds = cert_fetch_failure_cache_seconds
+        # Never start refreshing keys before they have been used for at least half of cert_cache_seconds
+        self.cert_refresh_seconds = min(cert_refresh_seconds, cert_cache_seconds // 2)
+        self.cached_public_keys: Dict[str, CachedPublicKey] = {}
+        # Optional certificate store shared with other processes on the same host
+        self.cert_store: Optional[FileCertificateStore] = None
+        if cert_cache_dir is not None:
+            try:
+                self.cert_store = FileCertificateStore(path=cert_cache_dir)
+            except OSError as e:
+                # Fetch certificates in every process rather than trusting a store someone else could write to
+                logger.error(f'Not sharing certificates between processes: {e}')
+        self.cert_store_poll_interval = 0.05
+        # Failed fetches are remembered for a short while so a broken cert endpoint is not hammered
+        self.failed_fetches: Dict[str, CachedFetchFailure] = {}
+        # One fetch per cert url at a time, shared by all requests waiting for that cert
+        self._pending_fetches: Dict[str, asyncio.Task] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # OpenSSL releases the GIL while verifying so a thread pool lets us verify several messages in parallel, a
+        # process pool also spreads the rest of the work over all cores while the caches stay in this process
+        self.verification_mode = verification_mode
+        self.verification_workers = verification_workers
+        self._executor: Optional[Executor] = None
+        if verification_mode is VerificationMode.thread_pool:
+            self._executor = ThreadPoolExecutor(max_workers=verification_workers, thread_name_prefix='sns_verify')
+        elif verification_mode is VerificationMode.process_pool:
+            # Do not fork the running event loop and its threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=verification_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        # Signatures to verify in the process pool, collected during one event loop iteration and sent in batches of
+        # verification_batch_size per certificate to save round trips to the pool
+        self.verification_batch_size = verification_batch_size
+        self._pending_verifications: Dict[bytes, Tuple[bytes, List[PendingVerification]]] = {}
+        self._verification_flush_scheduled = False
+        self._verification_tasks: Set[asyncio.Task] = set()
+        self.verified_messages: Optional[VerifiedMessageMemo] = None
+        if verified_message_memo_size > 0:
+            self.verified_messages = VerifiedMessageMemo(
+                max_size=verified_message_memo_size, ttl_seconds=verified_message_memo_seconds
+            )
 
-    def _verify_signature(self, message: Dict[str, Any]) -> None:
-        cert = None
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # Created on first use so that the client is bound to the running event loop
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.cert_fetch_timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.cert_fetch_max_connections,
+                    max_keepalive_connections=self.cert_fetch_max_connections,
+                ),
+            )
+        return self._http_client
+
+    async def start(self) -> None:
+        """ Start the verification pool processes, should be called on application startup. """
+        if self.verification_mode is VerificationMode.process_pool and self._executor is not None:
+            # Otherwise the processes are started by the first message, which then has to wait for all of them
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(
+                *[loop.run_in_executor(self._executor, _start_worker) for _ in range(self.verification_workers)]
+            )
+
+    async def aclose(self) -> None:
+        """ Close the pooled HTTP client and verification pool, should be called on application shutdown. """
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        if self._verification_tasks:
+            await asyncio.gather(*self._verification_tasks, return_exceptions=True)
+        if self._executor is not None:
+            # Wait for the pool to shut down, without blocking the event loop, so that no worker is left behind
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+            self._executor = None
+
+    def _get_cached_public_key(self, cert_url: str, now: datetime) -> Optional[CachedPublicKey]:
+        cached_key = self.cached_public_keys.get(cert_url)
+        if cached_key:
+            # If cached key is new enough use it
+            if cached_key.added + timedelta(seconds=self.cert_cache_seconds) > now:
+                return cached_key
+            # Remove the cached key after cert_cache_seconds
+            del self.cached_public_keys[cert_url]
+        return None
+
+    def _refresh_after(self, added: datetime) -> datetime:
+        return added + timedelta(seconds=self.cert_cache_seconds - self.cert_refresh_seconds)
+
+    def _cache_public_key(self, cert_url: str, pem: bytes, added: Optional[datetime] = None) -> _RSAPublicKey:
+        if added is None:
+            added = utc_now()
+        try:
+            public_key = load_public_key(pem)
+        except ValueError:
+            # Not a PEM encoded certificate
+            raise SignatureVerificationFailureException('Failed to load cert file.')
+        self.cached_public_keys[cert_url] = CachedPublicKey(
+            public_key=public_key, pem=pem, key_id=public_key_id(pem), added=added
+        )
+        return public_key
+
+    async def _download_certificate(self, cert_url: str) -> bytes:
+        try:
+            with CERT_FETCH_SECONDS.time():
+                resp = await self.http_client.get(cert_url)
+            resp.raise_for_status()  # Raise HTTPStatusError on error codes
+        except httpx.HTTPError:
+            # Includes connection errors and timeouts
+            raise SignatureVerificationFailureException('Failed to fetch cert file.')
+        return resp.content
+
+    async def _fetch_public_key(self, cert_url: str) -> _RSAPublicKey:
+        if self.cert_store is None:
+            return self._cache_public_key(cert_url, await self._download_certificate(cert_url))
+
+        # Make sure only one process on this host downloads the certificate, the others will find it in the store
+        try:
+            lock_fd = self.cert_store.try_lock(cert_url)
+            while lock_fd is None:
+                await asyncio.sleep(self.cert_store_poll_interval)
+                lock_fd = self.cert_store.try_lock(cert_url)
+        except OSError as e:
+            logger.warning(f'Could not lock certificate store for {cert_url}, downloading without it: {e}')
+            return self._cache_public_key(cert_url, await self._download_certificate(cert_url))
+        try:
+            stored = self.cert_store.get(cert_url)
+            if stored is not None and self._refresh_after(stored.added) > utc_now():
+                return self._cache_public_key(cert_url, stored.pem, added=stored.added)
+            pem = await self._download_certificate(cert_url)
+            added = utc_now()
+            # Only share certificates that could be loaded
+            public_key = self._cache_public_key(cert_url, pem, added=added)
+            self.cert_store.put(cert_url, pem, added=added)
+            return public_key
+        finally:
+            self.cert_store.unlock(lock_fd)
+
+    def _fetch_done(self, cert_url: str, task: asyncio.Task) -> None:
+        del self._pending_fetches[cert_url]
+        if task.cancelled():
+            return
+        exc = task.exception()  # Also marks the exception as retrieved if nobody is waiting for it
+        if exc is not None and self.cert_fetch_failure_cache_seconds > 0:
+            self.failed_fetches[cert_url] = CachedFetchFailure(reason=str(exc), added=utc_now())
+
+    def _get_fetch_failure(self, cert_url: str, now: datetime) -> Optional[CachedFetchFailure]:
+        failure = self.failed_fetches.get(cert_url)
+        if failure:
+            if failure.added + timedelta(seconds=self.cert_fetch_failure_cache_seconds) > now:
+                return failure
+            del self.failed_fetches[cert_url]
+        return None
+
+    def _start_fetch(self, cert_url: str) -> asyncio.Task:
+        task = self._pending_fetches.get(cert_url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_public_key(cert_url))
+            task.add_done_callback(partial(self._fetch_done, cert_url))
+            self._pending_fetches[cert_url] = task
+        return task
+
+    async def _get_public_key(self, cert_url: str) -> _RSAPublicKey:
+        now = utc_now()
+        cached_key = self._get_cached_public_key(cert_url, now)
+        if cached_key is not None:
+            CERT_CACHE_HIT.inc()
+            # Refresh the key in the background shortly before it expires, the current key is used until then
+            if self._refresh_after(cached_key.added) <= now and self._get_fetch_failure(cert_url, now) is None:
+                self._start_fetch(cert_url)
+            return cached_key.public_key
+
+        failure = self._get_fetch_failure(cert_url, now)
+        if failure is not None:
+            CERT_CACHE_FAILURE.inc()
+            raise SignatureVerificationFailureException(failure.reason)
+
+        CERT_CACHE_MISS.inc()
+        # Shield the shared fetch so that one cancelled request does not cancel it for everyone else
+        return await asyncio.shield(self._start_fetch(cert_url))
+
+    @staticmethod
+    def _get_cert_url(message: Dict[str, Any]) -> str:
         cert_url = message.get('SigningCertURL')
         if not cert_url:
             raise SignatureVerificationFailureException('SigningCertURL not found')
+        return cert_url
 
-        cached_cert = self.cached_certificates.get(cert_url)
-        if cached_cert:
-            # If cached cert if new enough use it
-            if cached_cert.added + timedelta(seconds=self.cert_cache_seconds) > utc_now():
-                cert = cached_cert.cert
-            else:
-                # Remove the cached cert after cert_cache_seconds
-                del self.cached_certificates[cert_url]
+    def _verify_signature_with_public_key(self, message: Dict[str, Any], public_key: _RSAPublicKey) -> None:
+        plaintext = self._get_plaintext_to_sign(message).encode()
+        b64_signature = message.get('Signature')
+        if not b64_signature:
+            raise SignatureVerificationFailureException('Signature not found')
+        signature = base64.b64decode(b64_signature)
+        try:
+            public_key.verify(signature=signature, data=plaintext, algorithm=SHA1(), padding=PKCS1v15())
+        except InvalidSignature:
+            raise SignatureVerificationFailureException('Invalid signature.')
+
+    def _verify_signature(self, message: Dict[str, Any]) -> None:
+        """ Blocking signature verification, do not use from the event loop. """
+        cert_url = self._get_cert_url(message)
+        cached_key = self._get_cached_public_key(cert_url, utc_now())
+        if cached_key is not None:
+            self._verify_signature_with_public_key(message, cached_key.public_key)
+            return None
 
-        if cert is None:
+        stored = self.cert_store.get(cert_url) if self.cert_store is not None else None
+        if stored is not None and self._refresh_after(stored.added) > utc_now():
+            public_key = self._cache_public_key(cert_url, stored.pem, added=stored.added)
+        else:
             try:
-                resp = requests.get(cert_url)
+                resp = requests.get(cert_url, timeout=self.cert_fetch_timeout_seconds)
                 resp.raise_for_status()  # Raise HTTPError on error codes
                 pem = resp.content
-            except requests.exceptions.HTTPError:
+            except requests.exceptions.RequestException:
                 raise SignatureVerificationFailureException('Failed to fetch cert file.')
-            cert = load_pem_x509_certificate(pem, default_backend())
-            self.cached_certificates[cert_url] = CachedCertificate(cert=cert, added=utc_now())
+            added = utc_now()
+            public_key = self._cache_public_key(cert_url, pem, added=added)
+            if self.cert_store is not None:
+                self.cert_store.put(cert_url, pem, added=added)
+        self._verify_signature_with_public_key(message, public_key)
+
+    async def _verify_signature_async(self, message: Dict[str, Any], timings: RequestTimings = NULL_TIMINGS) -> None:
+        cert_url = self._get_cert_url(message)
+        with timings.stage('cert'):
+            public_key = await self._get_public_key(cert_url)
+        start = time.perf_counter()
+        with timings.stage('verify'):
+            if self._executor is None:
+                self._verify_signature_with_public_key(message, public_key)
+            elif self.verification_mode is VerificationMode.process_pool:
+                await self._verify_signature_in_process(message, self.cached_public_keys[cert_url])
+            else:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._verify_signature_with_public_key, message, public_key
+                )
+        SIGNATURE_VERIFICATION_SECONDS.observe(time.perf_counter() - start)
 
-        # Explicitly type public_key to please mypy
-        public_key: _RSAPublicKey = cert.public_key()
+    async def _verify_signature_in_process(self, message: Dict[str, Any], cached_key: CachedPublicKey) -> None:
         plaintext = self._get_plaintext_to_sign(message).encode()
         b64_signature = message.get('Signature')
         if not b64_signature:
             raise SignatureVerificationFailureException('Signature not found')
         signature = base64.b64decode(b64_signature)
+        loop = asyncio.get_running_loop()
+        verification = PendingVerification(plaintext=plaintext, signature=signature, future=loop.create_future())
+        if cached_key.key_id not in self._pending_verifications:
+            self._pending_verifications[cached_key.key_id] = (cached_key.pem, [])
+        self._pending_verifications[cached_key.key_id][1].append(verification)
+        if not self._verification_flush_scheduled:
+            # Runs after all requests that are ready in this event loop iteration have added their signatures
+            self._verification_flush_scheduled = True
+            loop.call_soon(self._flush_verifications)
+        error = await verification.future
+        if error is not None:
+            raise SignatureVerificationFailureException(error)
+
+    def _flush_verifications(self) -> None:
+        self._verification_flush_scheduled = False
+        pending, self._pending_verifications = self._pending_verifications, {}
+        for key_id, (pem, verifications) in pending.items():
+            for start in range(0, len(verifications), self.verification_batch_size):
+                chunk = verifications[start : start + self.verification_batch_size]
+                task = asyncio.ensure_future(self._verify_chunk_in_process(key_id, pem, chunk))
+                self._verification_tasks.add(task)
+                task.add_done_callback(self._verification_tasks.discard)
+
+    async def _verify_chunk_in_process(self, key_id: bytes, pem: bytes, chunk: List[PendingVerification]) -> None:
+        # Public key objects can not be pickled, the worker processes parse the certificate once and keep the key
+        loop = asyncio.get_running_loop()
+        signed_data = [(verification.plaintext, verification.signature) for verification in chunk]
+        errors: List[Optional[str]]
         try:
-            public_key.verify(signature=signature, data=plaintext, algorithm=SHA1(), padding=PKCS1v15())
-        except InvalidSignature:
-            raise SignatureVerificationFailureException('Invalid signature.')
+            key_id_errors = await loop.run_in_executor(
+                self._executor, verify_signatures_with_key_id, key_id, signed_data
+            )
+            if key_id_errors is None:
+                # First use of the certificate in that process
+                errors = await loop.run_in_executor(self._executor, verify_signatures, pem, signed_data)
+            else:
+                errors = key_id_errors
+        except Exception as e:
+            for verification in chunk:
+                if not verification.future.done():
+                    verification.future.set_exception(e)
+            return None
+        for verification, error in zip(chunk, errors):
+            # The request might have been cancelled while waiting
+            if not verification.future.done():
+                verification.future.set_result(error)
+
+    async def validate_message_async(self, message: Dict[str, Any], timings: RequestTimings = NULL_TIMINGS) -> None:
+        """ Same checks as validate_message but fetches certificates without blocking the event loop. """
+        self.validate_message_type(message.get('Type'))
+        self._validate_signature_version(message)
+        self._validate_cert_url(message)
+        if self.verified_messages is None:
+            await self._verify_signature_async(message, timings)
+        elif self.verified_messages.contains(message):
+            VERIFIED_MESSAGE_MEMO_HIT.inc()
+        else:
+            VERIFIED_MESSAGE_MEMO_MISS.inc()
+            await self._verify_signature_async(message, timings)
+            self.verified_messages.add(message)
+
+    def _prepare_batch_message(self, message: Any) -> Tuple[str, bytes, bytes]:
+        """ Run all checks but the signature verification and return the cert url, plaintext and signature. """
+        if not isinstance(message, dict):
+            raise ValueError('Message is not a JSON object')
+        self.validate_message_type(message.get('Type'))
+        self._validate_signature_version(message)
+        self._validate_cert_url(message)
+        cert_url = self._get_cert_url(message)
+        b64_signature = message.get('Signature')
+        if not b64_signature:
+            raise SignatureVerificationFailureException('Signature not found')
+        signature = base64.b64decode(b64_signature)
+        return cert_url, self._get_plaintext_to_sign(message).encode(), signature
+
+    async def validate_messages_async(
+        self,
+        messages: Iterable[Any],
+        executor: Optional[Executor] = None,
+        batch_size: int = 1000,
+        chunk_size: int = 100,
+    ) -> AsyncIterator[BatchVerificationResult]:
+        """
+        Validate a stream of messages and yield a result for each message, in the same order.
+
+        Messages are read batch_size at a time. The messages in a batch are grouped by SigningCertURL, each
+        certificate is fetched once, and the signatures are verified in chunks of chunk_size messages in executor.
+        Use a ProcessPoolExecutor to verify on all CPU cores, the default is the event loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+        iterator = iter(messages)
+        offset = 0
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return
+            results: List[Optional[BatchVerificationResult]] = [None] * len(batch)
+            signed_data: Dict[int, Tuple[bytes, bytes]] = {}
+            by_cert_url: Dict[str, List[int]] = defaultdict(list)
+            for i, message in enumerate(batch):
+                try:
+                    cert_url, plaintext, signature = self._prepare_batch_message(message)
+                except (
+                    InvalidMessageTypeException,
+                    InvalidCertURLException,
+                    InvalidSignatureVersionException,
+                    SignatureVerificationFailureException,
+                    ValueError,  # Includes binascii.Error from b64decode
+                ) as e:
+                    results[i] = BatchVerificationResult(index=offset + i, message=message, error=str(e))
+                    continue
+                signed_data[i] = (plaintext, signature)
+                by_cert_url[cert_url].append(i)
+
+            # Fetch all certificates in the batch at once
+            cert_urls = list(by_cert_url)
+            public_keys = await asyncio.gather(
+                *[self._get_public_key(url) for url in cert_urls], return_exceptions=True
+            )
+            pending = []
+            for cert_url, public_key in zip(cert_urls, public_keys):
+                indexes = by_cert_url[cert_url]
+                # CancelledError is an Exception before Python 3.8
+                if isinstance(public_key, Exception) and not isinstance(public_key, asyncio.CancelledError):
+                    # A certificate that could not be fetched or loaded only fails the messages signed with it
+                    for i in indexes:
+                        results[i] = BatchVerificationResult(index=offset + i, message=batch[i], error=str(public_key))
+                    continue
+                elif isinstance(public_key, BaseException):
+                    raise public_key
+                pem = self.cached_public_keys[cert_url].pem
+                for start in range(0, len(indexes), chunk_size):
+                    chunk = indexes[start : start + chunk_size]
+                    future = loop.run_in_executor(executor, verify_signatures, pem, [signed_data[i] for i in chunk])
+                    pending.append((chunk, future))
+
+            for chunk, future in pending:
+                for i, error in zip(chunk, await future):
+                    results[i] = BatchVerificationResult(index=offset + i, message=batch[i], error=error)
+
+            for result in results:
+                assert result is not None  # please mypy
+                yield result
+            offset += len(batch)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics.
+
+When running more than one worker process PROMETHEUS_MULTIPROC_DIR has to point to an empty directory shared by all
+workers, and be set before this module is imported, for the metrics to be aggregated over all workers. See
+docker/start.sh and sns_monitor.gunicorn_config.
+"""
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+__author__ = 'lundberg'
+
+# RSA signature verification takes well under a millisecond
+VERIFICATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+MESSAGES = Counter(
+    'sns_monitor_messages',
+    'Verified messages received by message type and topic, topics not in a configured allow list are counted as other',
+    ['message_type', 'topic'],
+)
+VALIDATION_FAILURES = Counter(
+    'sns_monitor_validation_failures', 'Messages failing validation by exception class', ['exception']
+)
+SIGNATURE_VERIFICATION_SECONDS = Histogram(
+    'sns_monitor_signature_verification_seconds',
+    'Time to verify a message signature, excluding getting the certificate',
+    buckets=VERIFICATION_BUCKETS,
+)
+CERT_CACHE = Counter('sns_monitor_cert_cache', 'Certificate cache lookups by result (hit, miss or failure)', ['result'])
+CERT_FETCH_SECONDS = Histogram('sns_monitor_cert_fetch_seconds', 'Time to download a signing certificate')
+VERIFIED_MESSAGE_MEMO = Counter(
+    'sns_monitor_verified_message_memo', 'Verified message memo lookups by result (hit or miss)', ['result']
+)
+
+# Bind the fixed label values up front to keep label lookups off the hot path
+CERT_CACHE_HIT = CERT_CACHE.labels('hit')
+CERT_CACHE_MISS = CERT_CACHE.labels('miss')
+CERT_CACHE_FAILURE = CERT_CACHE.labels('failure')
+VERIFIED_MESSAGE_MEMO_HIT = VERIFIED_MESSAGE_MEMO.labels('hit')
+VERIFIED_MESSAGE_MEMO_MISS = VERIFIED_MESSAGE_MEMO.labels('miss')
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """ Metrics in the Prometheus text format, for all workers when running in multiprocess mode. """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
-import json
 import logging
+from typing import Optional
 
 from sns_message_validator import (
     InvalidCertURLException,
@@ -9,56 +9,134 @@ from sns_message_validator import (
     SignatureVerificationFailureException,
 )
 from starlette import status
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect
 from starlette.responses import PlainTextResponse
-from starlette.types import ASGIApp, Message
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from sns_monitor import json_codec
 from sns_monitor.message_validation import CachedSNSMessageValidator
+from sns_monitor.metrics import VALIDATION_FAILURES
+from sns_monitor.models import SNSEnvelope
+from sns_monitor.timing import NULL_TIMINGS, RequestTimer, RequestTimings
 
 __author__ = 'lundberg'
 
 logger = logging.getLogger(__name__)
 
+SNS_MESSAGE_ID_HEADER = b'x-amz-sns-message-id'
 
-# Hack to be able to get request body both now and later
-# https://github.com/encode/starlette/issues/495#issuecomment-513138055
-async def set_body(request: Request, body: bytes):
-    async def receive() -> Message:
-        return {'type': 'http.request', 'body': body}
 
-    request._receive = receive
+async def read_body(receive: Receive) -> bytes:
+    """ Read the complete request body from the ASGI receive channel. """
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnect()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    if len(chunks) == 1:
+        # Usually the whole body arrives in one message, avoid copying it
+        return chunks[0]
+    return b''.join(chunks)
 
 
-async def get_body(request: Request) -> bytes:
-    body = await request.body()
-    await set_body(request, body)
-    return body
+def replay_body(body: bytes, receive: Receive) -> Receive:
+    """ Return a receive channel that hands out an already read body before falling back to the original channel. """
+    body_sent = False
 
+    async def replay() -> Message:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Let the app wait for http.disconnect as usual
+        return await receive()
 
-class VerifySNSMessageSignature(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, cert_cache_seconds: int):
-        super().__init__(app)
-        self.message_validator = CachedSNSMessageValidator(cert_cache_seconds=cert_cache_seconds)
+    return replay
 
-    async def dispatch(self, request: Request, call_next):
+
+class VerifySNSMessageSignature:
+    """
+    ASGI middleware verifying the signature of SNS messages.
+
+    The body is read and decoded once. After verification an SNSEnvelope is put in request.state.sns_message for the
+    route to use and the unchanged body is handed to the rest of the app.
+
+    If request_timer is enabled the time spent in each stage is recorded in request.state.timings, see
+    sns_monitor.timing.
+    """
+
+    def __init__(
+        self, app: ASGIApp, message_validator: CachedSNSMessageValidator, request_timer: Optional[RequestTimer] = None
+    ):
+        self.app = app
+        self.message_validator = message_validator
+        self.request_timer = request_timer or RequestTimer()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or not any(name == SNS_MESSAGE_ID_HEADER for name, _ in scope['headers']):
+            await self.app(scope, receive, send)
+            return
+
+        timings = self.request_timer.new_timings()
+        if timings is NULL_TIMINGS:
+            await self.verify(scope, receive, send, timings)
+            return
+
+        if self.request_timer.server_timing_header:
+            send = self.send_with_server_timing(send, timings)
+        try:
+            with timings.stage('total'):
+                await self.verify(scope, receive, send, timings)
+        finally:
+            self.request_timer.finish(scope, timings)
+
+    @staticmethod
+    def send_with_server_timing(send: Send, timings: RequestTimings) -> Send:
+        async def wrapped_send(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', timings.server_timing().encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        return wrapped_send
+
+    async def verify(self, scope: Scope, receive: Receive, send: Send, timings: RequestTimings) -> None:
         # Verify message signature when we have the raw body to work with
-        if 'x-amz-sns-message-id' in request.headers:
-            try:
-                body = json.loads(await get_body(request))
-                self.message_validator.validate_message(message=body)
-            except (
-                InvalidMessageTypeException,
-                InvalidCertURLException,
-                InvalidSignatureVersionException,
-                SignatureVerificationFailureException,
-                ValueError,
-            ) as e:
-                logger.error(f'Message validation failed: {e}')
-                logger.debug(f'Headers: {request.headers}')
-                body = await get_body(request)
-                logger.debug(f'Body: {body.decode()}')
-                return PlainTextResponse('Unprocessable Entity', status.HTTP_422_UNPROCESSABLE_ENTITY)
-
-        response = await call_next(request)
-        return response
+        try:
+            with timings.stage('body'):
+                body = await read_body(receive)
+        except ClientDisconnect:
+            return
+
+        try:
+            with timings.stage('json'):
+                message = json_codec.loads(body)
+            if not isinstance(message, dict):
+                raise ValueError('Message is not a JSON object')
+            await self.message_validator.validate_message_async(message=message, timings=timings)
+            with timings.stage('envelope'):
+                sns_message = SNSEnvelope(message)
+        except (
+            InvalidMessageTypeException,
+            InvalidCertURLException,
+            InvalidSignatureVersionException,
+            SignatureVerificationFailureException,
+            ValueError,
+        ) as e:
+            VALIDATION_FAILURES.labels(type(e).__name__).inc()
+            logger.error(f'Message validation failed: {e}')
+            logger.debug(f'Headers: {Headers(scope=scope)}')
+            logger.debug(f'Body: {body.decode(errors="replace")}')
+            response = PlainTextResponse('Unprocessable Entity', status.HTTP_422_UNPROCESSABLE_ENTITY)
+            await response(scope, receive, send)
+            return
+
+        state = scope.setdefault('state', {})
+        state['sns_message'] = sns_message
+        state['timings'] = timings
+        await self.app(scope, replay_body(body, receive), send)
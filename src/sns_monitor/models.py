@@ -2,10 +2,12 @@
 import logging
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, Field, HttpUrl
 
+from sns_monitor import json_codec
+
 __author__ = 'lundberg'
 
 logger = logging.getLogger(__name__)
@@ -20,6 +22,7 @@ class MessageType(str, Enum):
 class SNSMessage(BaseModel):
     class Config:
         arbitrary_types_allowed = True
+        json_loads = json_codec.loads
 
     type: MessageType = Field(alias='Type')
     timestamp: datetime = Field(alias='Timestamp')
@@ -35,3 +38,72 @@ class SNSMessage(BaseModel):
     token: Optional[str] = Field(alias='Token')
     # For type NOTIFICATION
     unsubscribe_url: Optional[HttpUrl] = Field(alias='UnsubscribeURL')
+
+
+class SNSEnvelope:
+    """
+    Lightweight SNS message used on the receive path.
+
+    Only the fields needed for routing are validated, the full SNSMessage is parsed on first access of `model`.
+    """
+
+    __slots__ = ('data', 'type', 'topic_arn', 'message_id', '_model')
+
+    def __init__(self, data: Dict[str, Any]):
+        try:
+            self.type = MessageType(data.get('Type'))
+        except ValueError:
+            raise ValueError(f'Invalid message type: {data.get("Type")}')
+        self.topic_arn: str = data.get('TopicArn')  # type: ignore
+        self.message_id: str = data.get('MessageId')  # type: ignore
+        if not isinstance(self.topic_arn, str) or not isinstance(self.message_id, str):
+            raise ValueError('TopicArn and MessageId are required')
+        if not isinstance(data.get('Message'), str):
+            raise ValueError('Message is required')
+        self.data = data
+        self._model: Optional[SNSMessage] = None
+
+    @property
+    def model(self) -> SNSMessage:
+        """ The fully validated message, raises pydantic.ValidationError if the message is invalid. """
+        if self._model is None:
+            self._model = SNSMessage.parse_obj(self.data)
+        return self._model
+
+    def log_fields(self) -> Dict[str, Any]:
+        """ Fields for structured logging, see sns_monitor.logging.JSONFormatter. """
+        fields = {
+            'message_type': self.type.value,
+            'message_id': self.message_id,
+            'topic_arn': self.topic_arn,
+            'sns_timestamp': self.timestamp,
+            'subject': self.subject,
+            'body': self.message,
+        }
+        if self.subscribe_url is not None:
+            fields['subscribe_url'] = self.subscribe_url
+        return fields
+
+    @property
+    def timestamp(self) -> str:
+        return self.data.get('Timestamp', '')
+
+    @property
+    def subject(self) -> Optional[str]:
+        return self.data.get('Subject')
+
+    @property
+    def message(self) -> str:
+        return self.data['Message']
+
+    @property
+    def subscribe_url(self) -> Optional[str]:
+        return self.data.get('SubscribeURL')
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.data.get('Token')
+
+    @property
+    def unsubscribe_url(self) -> Optional[str]:
+        return self.data.get('UnsubscribeURL')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Counter as CounterType
+from typing import Dict, List, Optional
+
+__author__ = 'lundberg'
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads in the running process from a background thread.
+
+    The result is in the collapsed stack format, one line per unique stack with the frames separated by semicolons
+    followed by the number of samples, as used by flamegraph.pl and speedscope.
+
+    Only one profile can run at a time in a process and the sampling thread always stops after the given duration,
+    even if nobody waits for the result.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, seconds: float, interval: float = 0.005):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = 0
+        self._stacks: CounterType[str] = Counter()
+
+    @staticmethod
+    def _format_frame(frame: FrameType) -> str:
+        code = frame.f_code
+        return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'
+
+    def _collapse(self, thread_name: str, frame: FrameType) -> str:
+        frames: List[str] = []
+        f: Optional[FrameType] = frame
+        while f is not None:
+            frames.append(self._format_frame(f))
+            f = f.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
+
+    def _sample(self, own_thread_id: int, thread_names: Dict[int, str]) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            if thread_id not in thread_names:
+                thread_names.update({t.ident: t.name for t in threading.enumerate() if t.ident is not None})
+            thread_name = thread_names.get(thread_id, str(thread_id))
+            self._stacks[self._collapse(thread_name, frame)] += 1
+
+    def run(self) -> str:
+        """ Sample for the configured number of seconds and return the collapsed stacks, blocks the calling thread. """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy('A profile is already running')
+        try:
+            own_thread_id = threading.get_ident()
+            thread_names: Dict[int, str] = {}
+            deadline = time.monotonic() + self.seconds
+            while time.monotonic() < deadline:
+                self._sample(own_thread_id, thread_names)
+                self.samples += 1
+                time.sleep(self.interval)
+        finally:
+            self._lock.release()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
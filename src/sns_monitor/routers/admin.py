@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import hmac
+import logging
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from starlette.responses import PlainTextResponse
+
+from sns_monitor.profiler import ProfilerBusy, SamplingProfiler
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+async def verify_admin_token(request: Request, authorization: str = Header('')):
+    admin_token = request.app.state.config.admin_token
+    scheme, _, token = authorization.partition(' ')
+    if not admin_token or scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        logger.warning(f'Unauthorized admin request from {request.client.host if request.client else "unknown"}')
+        raise HTTPException(status_code=401, detail="Unauthorized", headers={'WWW-Authenticate': 'Bearer'})
+
+
+admin_router = APIRouter(prefix='/admin', dependencies=[Depends(verify_admin_token)])
+
+
+@admin_router.get('/profile', response_class=PlainTextResponse)
+async def profile(
+    request: Request, seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, ge=1),
+):
+    """ Sample the stacks of this worker for a number of seconds and return them as collapsed stacks. """
+    max_seconds = request.app.state.config.admin_profile_max_seconds
+    if seconds > max_seconds:
+        raise HTTPException(status_code=422, detail=f"seconds can be at most {max_seconds}")
+
+    profiler = SamplingProfiler(seconds=seconds, interval=interval_ms / 1000)
+    logger.info(f'Profiling for {seconds} seconds')
+    try:
+        # Sample from another thread so that the event loop keeps running, and shows up in the profile
+        collapsed = await asyncio.get_running_loop().run_in_executor(None, profiler.run)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    logger.info(f'Profiling done, {profiler.samples} samples')
+    return PlainTextResponse(collapsed)
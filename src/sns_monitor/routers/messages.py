@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.openapi.models import Response
 
-from sns_monitor.dependencies import verify_topic
-from sns_monitor.models import MessageType, SNSMessage
+from sns_monitor.dedup import MessageDeduplicator
+from sns_monitor.dependencies import get_sns_message, get_topic_allow_list, verify_topic
+from sns_monitor.handlers import HandlerRegistry
+from sns_monitor.metrics import MESSAGES
+from sns_monitor.models import MessageType, SNSEnvelope
+from sns_monitor.timing import NULL_TIMINGS
 
 __author__ = 'lundberg'
 
@@ -15,41 +20,92 @@ logger = logging.getLogger(__name__)
 message_log_router = APIRouter(prefix='/messages', dependencies=[Depends(verify_topic)])
 
 
-async def handle_subscription_confirmation(message: SNSMessage):
-    logger.info('****************************************')
-    logger.info(f'Timestamp: {message.timestamp}')
-    logger.info(f'Subject: {message.subject}')
-    logger.info(message.message)
-    logger.info(f'Subscribe URL: {message.subscribe_url}')
-    logger.info('****************************************')
+async def handle_subscription_confirmation(message: SNSEnvelope):
+    logger.info(
+        f'Subscription confirmation - Timestamp: {message.timestamp} - Topic: {message.topic_arn} - '
+        f'Subject: {message.subject} - Subscribe URL: {message.subscribe_url} - Message: {message.message}',
+        extra={'sns_message': message.log_fields()},
+    )
 
 
-async def handle_unsubscribe_confirmation(message: SNSMessage):
-    logger.info('xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx')
-    logger.info(f'Timestamp: {message.timestamp}')
-    logger.info(f'Subject: {message.subject}')
-    logger.info(message.message)
-    logger.info('xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx')
+async def handle_unsubscribe_confirmation(message: SNSEnvelope):
+    logger.info(
+        f'Unsubscribe confirmation - Timestamp: {message.timestamp} - Topic: {message.topic_arn} - '
+        f'Subject: {message.subject} - Message: {message.message}',
+        extra={'sns_message': message.log_fields()},
+    )
 
 
-async def handle_notification(message: SNSMessage):
-    logger.info('----------------------------------------')
-    logger.info(f'Timestamp: {message.timestamp}')
-    logger.info(f'Message ID: {message.message_id}')
-    logger.info(f'Topic: {message.topicArn}')
-    logger.info(f'Subject: {message.subject}')
-    logger.info(message.message)
-    logger.info('----------------------------------------')
+async def handle_notification(message: SNSEnvelope):
+    logger.info(
+        f'Notification - Timestamp: {message.timestamp} - Message ID: {message.message_id} - '
+        f'Topic: {message.topic_arn} - Subject: {message.subject} - Message: {message.message}',
+        extra={'sns_message': message.log_fields()},
+    )
 
 
-@message_log_router.post('/', status_code=200)
-async def receive_message(message: SNSMessage):
-    if message.type is MessageType.NOTIFICATION:
-        await handle_notification(message=message)
-    elif message.type is MessageType.SUBSCRIPTION_CONFIRMATION:
-        await handle_subscription_confirmation(message=message)
-    elif message.type is MessageType.UNSUBSCRIBE_CONFIRMATION:
-        await handle_unsubscribe_confirmation(message=message)
-    else:
-        logger.error(f'Unhandled message type {message.type} received')
+def register_default_handlers(registry: HandlerRegistry) -> None:
+    """ Log messages of all types from all topics. """
+    registry.register(handle_notification, message_type=MessageType.NOTIFICATION)
+    registry.register(handle_subscription_confirmation, message_type=MessageType.SUBSCRIPTION_CONFIRMATION)
+    registry.register(handle_unsubscribe_confirmation, message_type=MessageType.UNSUBSCRIBE_CONFIRMATION)
+
+
+async def handle_message(
+    message: SNSEnvelope, registry: HandlerRegistry, deduplicator: Optional[MessageDeduplicator] = None
+):
+    handlers = registry.get_handlers(message.topic_arn, message.type)
+    if not handlers:
+        logger.error(f'No handler for message type {message.type} from topic {message.topic_arn}')
         raise HTTPException(status_code=422, detail="Unprocessable Entity")
+    for handler in handlers:
+        await handler(message)
+
+    # Only remember messages that were handled so that a failed attempt can be redelivered
+    if deduplicator is not None:
+        deduplicator.add(dedup_key(message))
+
+
+def topic_label(request: Request, topic_arn: str) -> str:
+    """ Metrics label for a verified message, topics outside a configured allow list are counted as other. """
+    # Subscription confirmations are accepted from any topic, do not let them add series for disallowed topics
+    allow_list = get_topic_allow_list(request.app)
+    if not allow_list or topic_arn in allow_list:
+        return topic_arn
+    return 'other'
+
+
+def dedup_key(message: SNSEnvelope) -> str:
+    # MessageId is unique per published message, redeliveries and retries reuse it
+    return f'{message.topic_arn}:{message.message_id}'
+
+
+@message_log_router.post('/', status_code=200)
+async def receive_message(request: Request, message: SNSEnvelope = Depends(get_sns_message)):
+    MESSAGES.labels(message.type.value, topic_label(request, message.topic_arn)).inc()
+    deduplicator = request.app.state.message_deduplicator
+    if deduplicator is not None and deduplicator.seen(dedup_key(message)):
+        logger.debug(f'Duplicate message {message.message_id} acknowledged without handling')
+        return None
+
+    work_queue = request.app.state.message_work_queue
+    if work_queue is not None and work_queue.full():
+        # Let SNS retry later
+        logger.warning(f'Work queue full, message {message.message_id} rejected')
+        raise HTTPException(status_code=503, detail="Service Unavailable")
+
+    timings = getattr(request.state, 'timings', NULL_TIMINGS)
+    if request.app.state.message_sink is not None:
+        # Stored before it is handled so that a handler never sees a message that was not stored
+        with timings.stage('sink'):
+            await request.app.state.message_sink.write(message)
+
+    if work_queue is None:
+        with timings.stage('handlers'):
+            await handle_message(
+                message=message, registry=request.app.state.handler_registry, deduplicator=deduplicator
+            )
+    elif not work_queue.submit(message):
+        # The queue filled up during the sink write
+        logger.warning(f'Work queue full, message {message.message_id} rejected')
+        raise HTTPException(status_code=503, detail="Service Unavailable")
@@ -3,6 +3,9 @@
 import logging
 
 from fastapi import APIRouter
+from starlette.responses import Response
+
+from sns_monitor.metrics import generate_metrics
 
 __author__ = 'lundberg'
 
@@ -15,3 +18,9 @@ status_router = APIRouter(prefix='/status')
 @status_router.get('/healthy', status_code=200)
 async def receive_message():
     return {'message': 'STATUS_OK'}
+
+
+@status_router.get('/metrics', status_code=200)
+async def metrics():
+    content, content_type = generate_metrics()
+    return Response(content=content, media_type=content_type)
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+from sns_monitor import json_codec
+from sns_monitor.models import SNSEnvelope
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+class MessageSink(ABC):
+    """ Somewhere to durably put verified messages before they are handled. """
+
+    @abstractmethod
+    async def write(self, message: SNSEnvelope) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+
+class SegmentedFileSink(MessageSink):
+    """
+    Append-only message store made up of numbered segment files.
+
+    Every message is written as one JSON line to the current segment, NNNNNNNNNN.log, and its MessageId and byte
+    offset is written to the segment index, NNNNNNNNNN.idx. A new segment is started when the current one would grow
+    past segment_max_bytes.
+
+    Writes are flushed to the OS immediately but only fsynced every fsync_batch_size messages, or every
+    fsync_interval_seconds, so that requests do not have to wait for the disk. Set fsync_batch_size to 1 to fsync
+    every message before it is acknowledged.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        segment_max_bytes: int = 64 * 1024 * 1024,
+        fsync_batch_size: int = 100,
+        fsync_interval_seconds: float = 1.0,
+    ):
+        self.path = path
+        self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_batch_size = fsync_batch_size
+        self.fsync_interval_seconds = fsync_interval_seconds
+
+        segments = self.segments()
+        # Continue appending to the last segment
+        self._segment = segments[-1] if segments else 0
+        self._log: BinaryIO = self._log_path(self._segment).open('ab')
+        self._index: BinaryIO = self._index_path(self._segment).open('ab')
+        # Terminate records and index lines partially written before a crash so that the next ones are readable
+        self._segment_size = self._terminate_partial_line(self._log_path(self._segment), self._log)
+        self._terminate_partial_line(self._index_path(self._segment), self._index)
+        self._unsynced = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _log_path(self, segment: int) -> Path:
+        return self.path / f'{segment:010d}.log'
+
+    def _index_path(self, segment: int) -> Path:
+        return self.path / f'{segment:010d}.idx'
+
+    @staticmethod
+    def _terminate_partial_line(path: Path, f: BinaryIO) -> int:
+        """ Append a newline if the file does not end with one, returns the file size. """
+        size = f.tell()
+        if size:
+            with path.open('rb') as r:
+                r.seek(-1, os.SEEK_END)
+                last_byte = r.read(1)
+            if last_byte != b'\n':
+                f.write(b'\n')
+                f.flush()
+                size += 1
+        return size
+
+    def segments(self) -> List[int]:
+        return sorted(int(p.stem) for p in self.path.glob('*.log') if p.stem.isdigit())
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # Created on first use so that the lock is bound to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _fsync(self, log: BinaryIO, index: BinaryIO) -> None:
+        os.fsync(log.fileno())
+        os.fsync(index.fileno())
+
+    def _close_segment(self, log: BinaryIO, index: BinaryIO) -> None:
+        self._fsync(log, index)
+        log.close()
+        index.close()
+
+    async def sync(self) -> None:
+        """ fsync the current segment and its index in a worker thread. """
+        async with self.lock:
+            if not self._unsynced:
+                return None
+            self._unsynced = 0
+            await asyncio.get_running_loop().run_in_executor(None, self._fsync, self._log, self._index)
+
+    async def _periodic_sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.fsync_interval_seconds)
+            try:
+                await self.sync()
+            except OSError:
+                logger.exception('Failed to fsync message store')
+
+    def _needs_rotation(self, record_size: int) -> bool:
+        return self._segment_size > 0 and self._segment_size + record_size > self.segment_max_bytes
+
+    async def _rotate(self, record_size: int) -> None:
+        async with self.lock:
+            # Another write might already have rotated the segment while we waited for the lock
+            if not self._needs_rotation(record_size):
+                return None
+            # Switch to the new segment before the fsync so that writes can continue while the old one is synced
+            log, index = self._log, self._index
+            self._segment += 1
+            self._log = self._log_path(self._segment).open('ab')
+            self._index = self._index_path(self._segment).open('ab')
+            self._segment_size = 0
+            self._unsynced = 0
+            logger.info(f'Started message store segment {self._segment}')
+            await asyncio.get_running_loop().run_in_executor(None, self._close_segment, log, index)
+
+    async def write(self, message: SNSEnvelope) -> None:
+        if self._sync_task is None and self.fsync_interval_seconds > 0:
+            self._sync_task = asyncio.ensure_future(self._periodic_sync())
+
+        record = json_codec.dumps(message.data) + b'\n'
+        if self._needs_rotation(len(record)):
+            await self._rotate(len(record))
+
+        offset = self._segment_size
+        self._log.write(record)
+        self._log.flush()
+        self._index.write(f'{message.message_id}\t{offset}\n'.encode())
+        self._index.flush()
+        self._segment_size += len(record)
+
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch_size:
+            await self.sync()
+
+    async def aclose(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.sync()
+        self._log.close()
+        self._index.close()
+
+    def read_index(self, segment: int) -> Dict[str, int]:
+        """ MessageId to offset for all messages in a segment. """
+        index: Dict[str, int] = {}
+        with self._index_path(segment).open('rb') as f:
+            for line in f:
+                message_id, _, offset = line.rstrip(b'\n').decode().partition('\t')
+                if offset.isdigit():
+                    index[message_id] = int(offset)
+        return index
+
+    def _read_record(self, segment: int, offset: int) -> Optional[Dict[str, Any]]:
+        with self._log_path(segment).open('rb') as f:
+            f.seek(offset)
+            try:
+                return json_codec.loads(f.readline())
+            except ValueError:
+                return None
+
+    def find(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """ Look up a stored message by MessageId, searching the newest segment first. """
+        for segment in reversed(self.segments()):
+            offset = self.read_index(segment).get(message_id)
+            if offset is None:
+                continue
+            record = self._read_record(segment, offset)
+            # An index line cut short by a crash can have a truncated offset
+            if record is not None and record.get('MessageId') == message_id:
+                return record
+        return None
+
+    def replay(self, start_segment: int = 0) -> Iterator[Dict[str, Any]]:
+        """ Yield all stored messages in the order they were received. """
+        for segment in self.segments():
+            if segment < start_segment:
+                continue
+            with self._log_path(segment).open('rb') as f:
+                for line in f:
+                    try:
+                        yield json_codec.loads(line)
+                    except ValueError:
+                        # A partially written last line after a crash
+                        logger.warning(f'Skipping unreadable record in message store segment {segment}')
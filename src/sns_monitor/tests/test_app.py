@@ -1,38 +1,24 @@
 # -*- coding: utf-8 -*-
 import json
 import os
-from typing import Optional
+from typing import Any, Dict
 from unittest import TestCase, mock
 
+import httpx
 import pkg_resources
+from prometheus_client import REGISTRY
 from starlette.testclient import TestClient
 
 from sns_monitor.api import init_sns_monitor_api
+from sns_monitor.routers.messages import topic_label
+from sns_monitor.tests.utils import MockResponse, async_return
 
 __author__ = 'lundberg'
 
 
-class MockResponse:
-    def __init__(self, content: bytes = b'', json_data: Optional[dict] = None, status_code: int = 200):
-        self._content = content
-        self._json_data = json_data
-        self._status_code = status_code
-
-    @property
-    def content(self):
-        return self._content
-
-    @property
-    def json(self):
-        return self._json_data
-
-    def raise_for_status(self):
-        pass
-
-
 class TestApp(TestCase):
     def setUp(self) -> None:
-        self.config = {'app_name': 'test'}
+        self.config: Dict[str, Any] = {'app_name': 'test'}
         # Load test cert
         self.datadir = pkg_resources.resource_filename(__name__, 'data')
         with open(f'{self.datadir}{os.sep}test.crt', mode='rb') as f:
@@ -63,30 +49,214 @@ class TestApp(TestCase):
         # Setup test client
         self.client = TestClient(self.app)
 
-    @mock.patch('requests.get')
-    def test_post_notification(self, mock_get: mock.Mock) -> None:
-        mock_get.return_value = MockResponse(content=self.cert_bytes)
+    @mock.patch('httpx.AsyncClient.get')
+    def test_post_notification(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
 
         response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
         assert response.status_code == 200
         assert response.ok is True
 
-    @mock.patch('requests.get')
-    def test_accept_notification(self, mock_get: mock.Mock) -> None:
-        mock_get.return_value = MockResponse(content=self.cert_bytes)
+    @mock.patch('httpx.AsyncClient.get')
+    def test_cached_certificate(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+
+        for _ in range(3):
+            response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+            assert response.status_code == 200
+        assert mock_get.call_count == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_duplicate_message(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        # Disabled by default
+        assert self.app.state.message_deduplicator is None
+        self.config['message_dedup_capacity'] = 1000
+        app = init_sns_monitor_api(test_config=self.config)
+        client = TestClient(app)
+
+        for _ in range(2):
+            response = client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+            assert response.status_code == 200
+        assert app.state.message_deduplicator.duplicates == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_background_handling(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        self.config['message_handling_mode'] = 'background'
+        app = init_sns_monitor_api(test_config=self.config)
+        mock_handle = mock.MagicMock(side_effect=async_return())
+        app.state.handler_registry.register(mock_handle, topic_arn=self.body['TopicArn'])
+
+        with TestClient(app) as client:
+            response = client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+            assert response.status_code == 200
+        # The work queue is drained on shutdown
+        assert mock_handle.call_count == 1
+
+    @mock.patch('sns_monitor.workers.MessageWorkQueue.submit')
+    @mock.patch('sns_monitor.workers.MessageWorkQueue.full', return_value=True)
+    @mock.patch('httpx.AsyncClient.get')
+    def test_background_queue_full(
+        self, mock_get: mock.MagicMock, mock_full: mock.MagicMock, mock_submit: mock.MagicMock
+    ) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        self.config['message_handling_mode'] = 'background'
+        client = TestClient(init_sns_monitor_api(test_config=self.config))
+
+        response = client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 503
+        # Rejected before it is stored or queued
+        assert mock_submit.call_count == 0
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_topic_handler(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        mock_handle = mock.MagicMock(side_effect=async_return())
+        mock_other_handle = mock.MagicMock(side_effect=async_return())
+        self.app.state.handler_registry.register(mock_handle, topic_arn='arn:aws:sns:*:123456789012:MyTopic')
+        self.app.state.handler_registry.register(mock_other_handle, topic_arn='arn:aws:sns:*:123456789012:Other')
+
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 200
+        assert mock_handle.call_count == 1
+        assert mock_other_handle.call_count == 0
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_certificate_fetch_failure(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = httpx.ConnectTimeout('timed out')
+
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 422
+
+    def test_cert_url_regex(self) -> None:
+        self.config['cert_url_regex'] = r'^https://sns\.eu-north-1\.amazonaws\.com/'
+        client = TestClient(init_sns_monitor_api(test_config=self.config))
+        response = client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 422
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_server_timing(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        self.config['server_timing_header'] = True
+        app = init_sns_monitor_api(test_config=self.config)
+        spans = []
+        app.state.request_timer.add_listener(lambda scope, request_spans: spans.extend(request_spans))
+        client = TestClient(app)
+
+        response = client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 200
+        stages = [timing.split(';')[0] for timing in response.headers['server-timing'].split(', ')]
+        assert stages == ['body', 'json', 'cert', 'verify', 'envelope', 'handlers']
+        assert [span.name for span in spans] == stages + ['total']
+
+    def test_no_server_timing(self) -> None:
+        response = self.client.post('/messages/', data=b'not json', headers=self.headers)
+        assert response.status_code == 422
+        assert 'server-timing' not in response.headers
+
+    def test_reject_unverified_message(self) -> None:
+        headers = {k: v for k, v in self.headers.items() if k != 'x-amz-sns-message-id'}
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=headers)
+        assert response.status_code == 422
+
+    def test_invalid_body(self) -> None:
+        response = self.client.post('/messages/', data=b'not json', headers=self.headers)
+        assert response.status_code == 422
+        response = self.client.post('/messages/', data=b'[]', headers=self.headers)
+        assert response.status_code == 422
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_accept_notification(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
         self.app.state.config.topic_allow_list = ['arn:aws:sns:us-west-2:123456789012:MyTopic']
         response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
         assert response.status_code == 200
         assert response.ok is True
 
-    @mock.patch('requests.get')
-    def test_reject_notification(self, mock_get: mock.Mock) -> None:
-        mock_get.return_value = MockResponse(content=self.cert_bytes)
+    @mock.patch('httpx.AsyncClient.get')
+    def test_reject_notification(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
         self.app.state.config.topic_allow_list = ['some_other_topic']
         response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
         assert response.status_code == 400
 
+    @mock.patch('httpx.AsyncClient.get')
+    def test_topic_allow_list_pattern(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        self.app.state.config.topic_allow_list = ['arn:aws:sns:*:123456789012:My*']
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 200
+        # Replace the allow list at runtime
+        self.app.state.config.topic_allow_list = ['arn:aws:sns:*:123456789012:Other*']
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        assert response.status_code == 400
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_reject_notification_header_mismatch(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        self.app.state.config.topic_allow_list = ['some_other_topic']
+        # The signed message type is used, not the header
+        headers = dict(self.headers, **{'x-amz-sns-message-type': 'SubscriptionConfirmation'})
+        response = self.client.post('/messages/', data=json.dumps(self.body), headers=headers)
+        assert response.status_code == 400
+
+    def test_admin_profile(self) -> None:
+        response = self.client.get('/admin/profile', params={'seconds': 0.05})
+        assert response.status_code == 404
+
+        self.config['admin_token'] = 'secret'
+        self.config['admin_profile_max_seconds'] = 1
+        client = TestClient(init_sns_monitor_api(test_config=self.config))
+        response = client.get('/admin/profile', params={'seconds': 0.05})
+        assert response.status_code == 401
+        response = client.get('/admin/profile', params={'seconds': 0.05}, headers={'Authorization': 'Bearer wrong'})
+        assert response.status_code == 401
+
+        headers = {'Authorization': 'Bearer secret'}
+        response = client.get('/admin/profile', params={'seconds': 2}, headers=headers)
+        assert response.status_code == 422
+        response = client.get('/admin/profile', params={'seconds': 0.05}, headers=headers)
+        assert response.status_code == 200
+        stack, _, count = response.text.splitlines()[0].rpartition(' ')
+        assert stack.startswith('MainThread;')
+        assert int(count) > 0
+
     def test_status_healthy(self) -> None:
         response = self.client.get('/status/healthy')
         assert response.status_code == 200
         assert response.json() == {'message': 'STATUS_OK'}
+
+    def test_topic_label(self) -> None:
+        request = mock.MagicMock(app=self.app)
+        other_topic = 'arn:aws:sns:us-west-2:123456789012:Other'
+        assert topic_label(request, other_topic) == other_topic
+        self.app.state.config.topic_allow_list = [self.body['TopicArn']]
+        assert topic_label(request, self.body['TopicArn']) == self.body['TopicArn']
+        assert topic_label(request, other_topic) == 'other'
+
+    @mock.patch('httpx.AsyncClient.get')
+    def test_status_metrics(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        labels = {'message_type': 'Notification', 'topic': self.body['TopicArn']}
+        before = REGISTRY.get_sample_value('sns_monitor_messages_total', labels) or 0
+        failures_before = (
+            REGISTRY.get_sample_value('sns_monitor_validation_failures_total', {'exception': 'JSONDecodeError'}) or 0
+        )
+
+        # Labelled by topic without an allow list and when the topic is in it
+        self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        self.app.state.config.topic_allow_list = [self.body['TopicArn']]
+        self.client.post('/messages/', data=json.dumps(self.body), headers=self.headers)
+        self.client.post('/messages/', data=b'not json', headers=self.headers)
+
+        response = self.client.get('/status/metrics')
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'sns_monitor_signature_verification_seconds_bucket' in response.text
+        assert 'sns_monitor_cert_fetch_seconds_count' in response.text
+        assert REGISTRY.get_sample_value('sns_monitor_messages_total', labels) == before + 2
+        assert (
+            REGISTRY.get_sample_value('sns_monitor_validation_failures_total', {'exception': 'JSONDecodeError'})
+            == failures_before + 1
+        )
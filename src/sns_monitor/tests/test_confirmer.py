@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import List
+from unittest import TestCase
+
+from sns_monitor.confirmer import SubscriptionConfirmer
+from sns_monitor.models import SNSEnvelope
+from sns_monitor.tests.utils import async_test
+from sns_monitor.topics import TopicAllowList
+
+__author__ = 'lundberg'
+
+TOPIC = 'arn:aws:sns:us-west-2:123456789012:MyTopic'
+
+
+class StandInSNS(HTTPServer):
+    """ Local stand-in for the SNS ConfirmSubscription endpoint answering with the queued status codes. """
+
+    def __init__(self, status_codes: List[int]):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.status_codes = status_codes
+        self.requests: List[str] = []
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInSNS
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        status_code = self.server.status_codes.pop(0) if self.server.status_codes else 200
+        self.send_response(status_code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSubscriptionConfirmer(TestCase):
+    def setUp(self) -> None:
+        self.server = StandInSNS(status_codes=[])
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.confirmer = SubscriptionConfirmer(
+            allow_list=lambda: TopicAllowList([TOPIC]),
+            subscribe_url_regex=r'^http://127\.0\.0\.1:\d+/',
+            retries=2,
+            backoff_seconds=0.01,
+        )
+
+    def tearDown(self) -> None:
+        asyncio.get_event_loop().run_until_complete(self.confirmer.aclose())
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_envelope(self, topic_arn: str = TOPIC, subscribe_url: str = '') -> SNSEnvelope:
+        return SNSEnvelope(
+            {
+                'Type': 'SubscriptionConfirmation',
+                'MessageId': '165545c9-2a5c-472c-8df2-7ff2be2b3b1b',
+                'TopicArn': topic_arn,
+                'Message': 'You have chosen to subscribe to the topic',
+                'Token': 'token',
+                'SubscribeURL': subscribe_url or f'{self.base_url}?Action=ConfirmSubscription&Token=token',
+            }
+        )
+
+    async def wait_for_tasks(self) -> None:
+        await asyncio.gather(*self.confirmer._tasks)
+
+    @async_test
+    async def test_confirm(self) -> None:
+        await self.confirmer.handle(self.make_envelope())
+        await self.wait_for_tasks()
+        assert self.server.requests == ['/?Action=ConfirmSubscription&Token=token']
+
+    @async_test
+    async def test_retry(self) -> None:
+        self.server.status_codes = [503, 500]
+        assert await self.confirmer.confirm(TOPIC, f'{self.base_url}confirm') is True
+        assert len(self.server.requests) == 3
+
+    @async_test
+    async def test_give_up(self) -> None:
+        self.server.status_codes = [503, 503, 503]
+        assert await self.confirmer.confirm(TOPIC, f'{self.base_url}confirm') is False
+        assert len(self.server.requests) == 3
+
+    @async_test
+    async def test_no_retry_on_client_error(self) -> None:
+        self.server.status_codes = [403]
+        assert await self.confirmer.confirm(TOPIC, f'{self.base_url}confirm') is False
+        assert len(self.server.requests) == 1
+
+    @async_test
+    async def test_topic_not_allowed(self) -> None:
+        await self.confirmer.handle(self.make_envelope(topic_arn='arn:aws:sns:us-west-2:123456789012:Other'))
+        await self.wait_for_tasks()
+        assert self.server.requests == []
+
+    @async_test
+    async def test_invalid_subscribe_url(self) -> None:
+        await self.confirmer.handle(self.make_envelope(subscribe_url='https://example.com/confirm'))
+        await self.wait_for_tasks()
+        assert self.server.requests == []
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from sns_monitor.dedup import BloomFilter, MessageDeduplicator
+
+__author__ = 'lundberg'
+
+
+class TestBloomFilter(TestCase):
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=10000, error_rate=0.01)
+        for i in range(10000):
+            bloom.add(f'added-{i}')
+        assert all(f'added-{i}' in bloom for i in range(10000))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        assert false_positives < 200
+
+
+class TestMessageDeduplicator(TestCase):
+    def test_seen(self):
+        deduplicator = MessageDeduplicator(capacity=1000, error_rate=1e-6, window_seconds=60)
+        assert deduplicator.seen('1') is False
+        deduplicator.add('1')
+        assert deduplicator.seen('1') is True
+        assert deduplicator.seen('2') is False
+        assert deduplicator.duplicates == 1
+
+    def test_window(self):
+        with mock.patch('time.monotonic') as monotonic:
+            monotonic.return_value = 1000.0
+            deduplicator = MessageDeduplicator(capacity=1000, error_rate=1e-6, window_seconds=60)
+            deduplicator.add('1')
+            # Still remembered after one rotation
+            monotonic.return_value = 1061.0
+            deduplicator.add('2')
+            assert deduplicator.seen('1') is True
+            # Forgotten after two
+            monotonic.return_value = 1122.0
+            assert deduplicator.seen('1') is False
+            assert deduplicator.seen('2') is True
+            # Everything is forgotten after a long pause
+            monotonic.return_value = 2000.0
+            assert deduplicator.seen('2') is False
+
+    def test_capacity_rotation(self):
+        deduplicator = MessageDeduplicator(capacity=10, error_rate=1e-6, window_seconds=3600)
+        for i in range(25):
+            deduplicator.add(str(i))
+        assert deduplicator.seen('24') is True
+        assert deduplicator.seen('0') is False
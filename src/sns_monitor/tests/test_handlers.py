@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+from sns_monitor.handlers import HandlerRegistry
+from sns_monitor.models import MessageType
+
+__author__ = 'lundberg'
+
+TOPIC = 'arn:aws:sns:us-west-2:123456789012:MyTopic'
+
+
+async def log_all(message):
+    pass
+
+
+async def my_topic(message):
+    pass
+
+
+async def my_topic_notification(message):
+    pass
+
+
+async def other_account(message):
+    pass
+
+
+class TestHandlerRegistry(TestCase):
+    def setUp(self) -> None:
+        self.registry = HandlerRegistry(max_dispatch_size=3)
+        self.registry.register(log_all)
+        self.registry.register(my_topic, topic_arn=TOPIC)
+        self.registry.register(my_topic_notification, topic_arn=TOPIC, message_type=MessageType.NOTIFICATION)
+        self.registry.register(other_account, topic_arn='arn:aws:sns:*:210987654321:*')
+
+    def test_dispatch(self):
+        assert self.registry.get_handlers(TOPIC, MessageType.NOTIFICATION) == (
+            log_all,
+            my_topic,
+            my_topic_notification,
+        )
+        assert self.registry.get_handlers(TOPIC, MessageType.SUBSCRIPTION_CONFIRMATION) == (log_all, my_topic)
+        assert self.registry.get_handlers('arn:aws:sns:eu-west-1:210987654321:Topic', MessageType.NOTIFICATION) == (
+            log_all,
+            other_account,
+        )
+
+    def test_register_after_compile(self):
+        self.registry.compile()
+        assert self.registry.get_handlers('other', MessageType.NOTIFICATION) == (log_all,)
+
+        @self.registry.handler(topic_arn='other')
+        async def other(message):
+            pass
+
+        assert self.registry.get_handlers('other', MessageType.NOTIFICATION) == (log_all, other)
+
+    def test_bounded_dispatch_table(self):
+        for i in range(10):
+            assert self.registry.get_handlers(f'topic-{i}', MessageType.NOTIFICATION) == (log_all,)
+        assert len(self.registry._dispatch) <= 3 + len(MessageType)
+        assert self.registry.get_handlers(TOPIC, MessageType.NOTIFICATION)[-1] is my_topic_notification
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import queue
+import sys
+from typing import List
+from unittest import TestCase
+
+from sns_monitor.config import LogQueueOverflow
+from sns_monitor.logging import (
+    AppFilter,
+    BoundedQueueHandler,
+    JSONFormatter,
+    TimestampFormatter,
+    start_queue_logging,
+    stop_queue_logging,
+)
+
+__author__ = 'lundberg'
+
+
+class TestBoundedQueueHandler(TestCase):
+    @staticmethod
+    def make_record(msg: str) -> logging.LogRecord:
+        return logging.LogRecord('test', logging.INFO, __file__, 1, msg, None, None)
+
+    def emit_all(self, overflow: LogQueueOverflow) -> BoundedQueueHandler:
+        handler = BoundedQueueHandler(queue.Queue(maxsize=2), overflow=overflow)
+        for msg in ['first', 'second', 'third']:
+            handler.emit(self.make_record(msg))
+        return handler
+
+    def queued_messages(self, handler: BoundedQueueHandler):
+        return [handler._queue.get_nowait().getMessage() for _ in range(handler._queue.qsize())]
+
+    def test_drop_new(self):
+        handler = self.emit_all(LogQueueOverflow.drop_new)
+        assert handler.dropped == 1
+        assert self.queued_messages(handler) == ['first', 'second']
+
+    def test_drop_old(self):
+        handler = self.emit_all(LogQueueOverflow.drop_old)
+        assert handler.dropped == 1
+        assert self.queued_messages(handler) == ['second', 'third']
+
+    def test_start_and_stop(self):
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        records: List[logging.LogRecord] = []
+        capture = logging.Handler()
+        capture.emit = records.append  # type: ignore
+        root.addHandler(capture)
+        try:
+            queue_handler = start_queue_logging(size=10, overflow=LogQueueOverflow.block)
+            assert root.handlers == [queue_handler]
+            root.warning('queued')
+            stop_queue_logging()
+            assert root.handlers == handlers + [capture]
+            root.warning('after stop')
+            assert [record.getMessage() for record in records] == ['queued', 'after stop']
+        finally:
+            stop_queue_logging()
+            root.removeHandler(capture)
+
+    def test_keep_exception(self):
+        handler = BoundedQueueHandler(queue.Queue(maxsize=2))
+        try:
+            raise ValueError('test error')
+        except ValueError:
+            record = logging.LogRecord('test', logging.ERROR, __file__, 1, 'failed %s', ('once',), sys.exc_info())
+        handler.emit(record)
+        queued = handler._queue.get_nowait()
+        assert queued.getMessage() == 'failed once'
+        data = json.loads(JSONFormatter().format(queued))
+        assert data['message'] == 'failed once'
+        assert 'ValueError: test error' in data['exception']
+
+
+class TestTimestampFormatter(TestCase):
+    def test_cached_timestamps(self):
+        formatter = TimestampFormatter(fmt='{asctime} {message}')
+        cached_formatter = TimestampFormatter(fmt='{asctime} {message}', cached_timestamps=True)
+        for created in [1600000000.123, 1600000000.9994, 1600000001.0, 1600000001.5, 1600003600.25]:
+            record = logging.LogRecord('test', logging.INFO, __file__, 1, 'message', None, None)
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+            assert cached_formatter.format(record) == formatter.format(record)
+
+
+class TestJSONFormatter(TestCase):
+    def test_format(self):
+        formatter = JSONFormatter()
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'text message', None, None)
+        AppFilter(app_name='test_app').filter(record)
+        data = json.loads(formatter.format(record))
+        assert data['message'] == 'text message'
+        assert data['level'] == 'INFO'
+        assert data['app_name'] == 'test_app'
+
+    def test_format_sns_message(self):
+        formatter = JSONFormatter()
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'Notification', None, None)
+        record.__setattr__('sns_message', {'message_id': '1', 'topic_arn': 'arn', 'body': 'test\nmessage'})
+        line = formatter.format(record)
+        assert '\n' not in line
+        data = json.loads(line)
+        assert 'message' not in data
+        assert data['message_id'] == '1'
+        assert data['body'] == 'test\nmessage'
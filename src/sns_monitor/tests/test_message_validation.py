@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase, mock
+
+import httpx
+import pkg_resources
+from sns_message_validator import SignatureVerificationFailureException
+
+from sns_monitor.cert_store import FileCertificateStore
+from sns_monitor.config import VerificationMode
+from sns_monitor.message_validation import CachedSNSMessageValidator
+from sns_monitor.tests.utils import MockResponse, async_return, async_test
+
+__author__ = 'lundberg'
+
+
+class TestCachedSNSMessageValidator(TestCase):
+    def setUp(self) -> None:
+        self.datadir = pkg_resources.resource_filename(__name__, 'data')
+        with open(f'{self.datadir}{os.sep}test.crt', mode='rb') as f:
+            self.cert_bytes = f.read()
+
+        # Signed with tests/data/test.key, see tests/data/create_test_signature.py
+        self.message = {
+            'Type': 'Notification',
+            'MessageId': 'da41e39f-ea4d-435a-b922-c6aae3915ebe',
+            'TopicArn': 'arn:aws:sns:us-west-2:123456789012:MyTopic',
+            'Subject': 'test',
+            'Message': 'test message',
+            'Timestamp': '2012-04-25T21:49:25.719Z',
+            'SignatureVersion': '1',
+            'Signature': 'KsQfz4uV9wgpzkHWTzcG6RG1FbyZKk0pFm1hmJ76HCleXhARkLJkUyq4gD8vF19m9zVRz2K2zxlQlSVqyzsSUUYOY4NdvfTo66fJumHM7QxQ9nfWizVwno2qEnAYFnVIffHX4B3pPUp6ySogahNFMWnbayLL251tHaoCZC3sqGeF2vZk3VpGf0f/OuDOKtdPO94o7dlqrDE5kQtq7JEFPRogX0B4nRIBSzJm/0bY6VYElo8mu2pKRd2OnwSU9ZUEdFkWKjnN7mi4fmpZcEoJhHCyN9EFRG3qyh6yyP+X+3ZP9HJVJaJbdQxCbK19IwVjfsJ1mLtvsxoOu7dztdGWKw==',
+            'SigningCertURL': 'https://sns.us-west-2.amazonaws.com/SimpleNotificationService-f3ecfb7224c7233fe7bb5f59f96de52f.pem',
+            'UnsubscribeURL': 'https://sns.us-west-2.amazonaws.com/?Action=Unsubscribe&SubscriptionArn=arn:aws:sns:us-west-2:123456789012:MyTopic:2bcfbf39-05c3-41de-beaa-fcfcc21c8f55',
+        }
+        self.validator = CachedSNSMessageValidator(cert_cache_seconds=3600)
+
+    def tearDown(self) -> None:
+        asyncio.get_event_loop().run_until_complete(self.validator.aclose())
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_concurrent_fetches_are_coalesced(self, mock_get: mock.MagicMock) -> None:
+        async def slow_get(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return MockResponse(content=self.cert_bytes)
+
+        mock_get.side_effect = slow_get
+        await asyncio.gather(*[self.validator.validate_message_async(self.message) for _ in range(10)])
+        assert mock_get.call_count == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_failed_fetch_is_shared_and_cached(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = httpx.ConnectError('connection refused')
+
+        results = await asyncio.gather(
+            *[self.validator.validate_message_async(self.message) for _ in range(5)], return_exceptions=True
+        )
+        assert all(isinstance(result, SignatureVerificationFailureException) for result in results)
+        # Still within the negative cache window
+        with self.assertRaises(SignatureVerificationFailureException):
+            await self.validator.validate_message_async(self.message)
+        assert mock_get.call_count == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_public_key_refreshed_before_expiry(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        cert_url = self.message['SigningCertURL']
+        await self.validator.validate_message_async(self.message)
+
+        # Age the cached key in to the refresh window
+        cached_key = self.validator.cached_public_keys[cert_url]
+        cached_key.added = cached_key.added - timedelta(seconds=3600 - 60)
+        stale_added = cached_key.added
+
+        # The stale key is used while the refresh runs in the background
+        await self.validator.validate_message_async(self.message)
+        assert self.validator.cached_public_keys[cert_url] is cached_key
+
+        await asyncio.gather(*self.validator._pending_fetches.values())
+        assert mock_get.call_count == 2
+        assert self.validator.cached_public_keys[cert_url].added > stale_added
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_shared_certificate_store(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        with TemporaryDirectory() as cert_cache_dir:
+            # Two validators sharing a store, like two workers on the same host
+            validators = [
+                CachedSNSMessageValidator(cert_cache_seconds=3600, cert_cache_dir=Path(cert_cache_dir))
+                for _ in range(2)
+            ]
+            await asyncio.gather(*[validator.validate_message_async(self.message) for validator in validators])
+            assert mock_get.call_count == 1
+            added = {validator.cached_public_keys[self.message['SigningCertURL']].added for validator in validators}
+            assert len(added) == 1
+            # A restarted worker starts warm
+            restarted = CachedSNSMessageValidator(cert_cache_seconds=3600, cert_cache_dir=Path(cert_cache_dir))
+            await restarted.validate_message_async(self.message)
+            assert mock_get.call_count == 1
+
+    def test_unsafe_certificate_store(self) -> None:
+        with TemporaryDirectory() as cert_cache_dir:
+            os.chmod(cert_cache_dir, 0o777)
+            with self.assertRaises(PermissionError):
+                FileCertificateStore(path=Path(cert_cache_dir))
+            validator = CachedSNSMessageValidator(cert_cache_seconds=3600, cert_cache_dir=Path(cert_cache_dir))
+            assert validator.cert_store is None
+
+    @mock.patch('sns_monitor.cert_store.FileCertificateStore.try_lock', side_effect=PermissionError('read only'))
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_certificate_store_lock_failure(
+        self, mock_get: mock.MagicMock, mock_try_lock: mock.MagicMock
+    ) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        with TemporaryDirectory() as cert_cache_dir:
+            validator = CachedSNSMessageValidator(cert_cache_seconds=3600, cert_cache_dir=Path(cert_cache_dir))
+            await validator.validate_message_async(self.message)
+            assert mock_try_lock.call_count == 1
+            assert mock_get.call_count == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_thread_pool_verification(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        validator = CachedSNSMessageValidator(
+            cert_cache_seconds=3600, verification_mode=VerificationMode.thread_pool, verification_workers=2
+        )
+        try:
+            await asyncio.gather(*[validator.validate_message_async(self.message) for _ in range(10)])
+            with self.assertRaises(SignatureVerificationFailureException):
+                await validator.validate_message_async(dict(self.message, Message='tampered message'))
+        finally:
+            await validator.aclose()
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_process_pool_verification(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        validator = CachedSNSMessageValidator(
+            cert_cache_seconds=3600,
+            verification_mode=VerificationMode.process_pool,
+            verification_workers=2,
+            verification_batch_size=4,
+        )
+        try:
+            await validator.start()
+            assert len(validator._executor._processes) == 2  # type: ignore
+            with mock.patch.object(
+                validator, '_verify_chunk_in_process', wraps=validator._verify_chunk_in_process
+            ) as mock_verify_chunk:
+                # Signatures verified at the same time are sent to the pool in batches
+                await asyncio.gather(*[validator.validate_message_async(self.message) for _ in range(10)])
+                assert mock_verify_chunk.call_count == 3
+            with self.assertRaises(SignatureVerificationFailureException):
+                await validator.validate_message_async(dict(self.message, Message='tampered message'))
+            assert mock_get.call_count == 1
+        finally:
+            await validator.aclose()
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_verified_message_memo(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        validator = CachedSNSMessageValidator(cert_cache_seconds=3600, verified_message_memo_size=2)
+        assert validator.verified_messages is not None
+        await validator.validate_message_async(self.message)
+        await validator.validate_message_async(dict(self.message))
+        assert validator.verified_messages.hits == 1
+        assert validator.verified_messages.misses == 1
+
+        # Same MessageId and Signature but changed content must still be verified
+        with self.assertRaises(SignatureVerificationFailureException):
+            await validator.validate_message_async(dict(self.message, Message='tampered message'))
+        assert validator.verified_messages.misses == 2
+
+        # Bounded size
+        for i in range(3):
+            validator.verified_messages.add(dict(self.message, MessageId=str(i)))
+        assert len(validator.verified_messages) == 2
+        await validator.aclose()
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_batch_validation(self, mock_get: mock.MagicMock) -> None:
+        mock_get.side_effect = async_return(MockResponse(content=self.cert_bytes))
+        messages = [
+            self.message,
+            dict(self.message, Message='tampered'),
+            'not a message',
+            dict(self.message, SigningCertURL='https://example.com/cert.pem'),
+            self.message,
+        ]
+
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = [
+                result
+                async for result in self.validator.validate_messages_async(
+                    messages * 2, executor=executor, batch_size=4, chunk_size=1
+                )
+            ]
+        assert [result.index for result in results] == list(range(10))
+        assert [result.valid for result in results] == [True, False, False, False, True] * 2
+        assert results[1].error == 'Invalid signature.'
+        assert results[2].error == 'Message is not a JSON object'
+        assert results[3].error == 'Invalid certificate URL.'
+        assert mock_get.call_count == 1
+
+    @mock.patch('httpx.AsyncClient.get')
+    @async_test
+    async def test_batch_validation_invalid_certificate(self, mock_get: mock.MagicMock) -> None:
+        other_cert_url = 'https://sns.us-east-1.amazonaws.com/SimpleNotificationService-other.pem'
+
+        async def get(url, *args, **kwargs):
+            if url == other_cert_url:
+                return MockResponse(content=b'not a certificate')
+            return MockResponse(content=self.cert_bytes)
+
+        mock_get.side_effect = get
+        messages = [self.message, dict(self.message, SigningCertURL=other_cert_url), self.message]
+        results = [result async for result in self.validator.validate_messages_async(messages)]
+        assert [result.valid for result in results] == [True, False, True]
+        assert results[1].error == 'Failed to load cert file.'
+
+        with self.assertRaises(SignatureVerificationFailureException):
+            await self.validator.validate_message_async(dict(self.message, SigningCertURL=other_cert_url))
@@ -2,7 +2,7 @@
 import json
 from unittest import TestCase
 
-from sns_monitor.models import SNSMessage
+from sns_monitor.models import MessageType, SNSEnvelope, SNSMessage
 
 __author__ = 'lundberg'
 
@@ -27,3 +27,17 @@ class TestSNSMessage(TestCase):
         message2 = SNSMessage.parse_obj(message.dict(by_alias=True))
         assert message == message2
         assert json.dumps(self.data, sort_keys=True) == message2.json(by_alias=True, exclude_none=True, sort_keys=True)
+
+    def test_envelope(self):
+        envelope = SNSEnvelope(self.data)
+        assert envelope.type is MessageType.NOTIFICATION
+        assert envelope.topic_arn == self.data['TopicArn']
+        assert envelope.message_id == self.data['MessageId']
+        assert envelope.message == self.data['Message']
+        assert envelope.model == SNSMessage.parse_obj(self.data)
+        assert envelope.model is envelope.model
+
+    def test_envelope_invalid(self):
+        for key, value in [('Type', 'Unknown'), ('TopicArn', None), ('Message', None)]:
+            with self.assertRaises(ValueError):
+                SNSEnvelope(dict(self.data, **{key: value}))
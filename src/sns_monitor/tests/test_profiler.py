@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest import TestCase
+
+from sns_monitor.profiler import ProfilerBusy, SamplingProfiler
+
+__author__ = 'lundberg'
+
+
+def busy_wait(stop: threading.Event) -> None:
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+class TestSamplingProfiler(TestCase):
+    def test_collapsed_stacks(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_wait, args=(stop,), name='busy')
+        thread.start()
+        try:
+            profiler = SamplingProfiler(seconds=0.05, interval=0.001)
+            collapsed = profiler.run()
+        finally:
+            stop.set()
+            thread.join()
+
+        assert profiler.samples > 0
+        busy_stacks = [line for line in collapsed.splitlines() if line.startswith('busy;')]
+        assert busy_stacks
+        assert all('busy_wait (' in line for line in busy_stacks)
+        assert sum(int(line.rpartition(' ')[2]) for line in busy_stacks) == profiler.samples
+
+    def test_one_at_a_time(self):
+        first = SamplingProfiler(seconds=0.2)
+        thread = threading.Thread(target=first.run)
+        thread.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(ProfilerBusy):
+                SamplingProfiler(seconds=0.01).run()
+        finally:
+            thread.join()
+        # The lock is released when the first profile is done
+        SamplingProfiler(seconds=0.01).run()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sns_monitor.models import SNSEnvelope
+from sns_monitor.sinks import SegmentedFileSink
+from sns_monitor.tests.utils import async_test
+
+__author__ = 'lundberg'
+
+
+class TestSegmentedFileSink(TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = TemporaryDirectory()
+        self.path = Path(self.tmpdir.name)
+        self.data = {
+            'Type': 'Notification',
+            'MessageId': 'da41e39f-ea4d-435a-b922-c6aae3915ebe',
+            'TopicArn': 'arn:aws:sns:us-west-2:123456789012:MyTopic',
+            'Subject': 'test',
+            'Message': 'test message\nwith two lines',
+            'Timestamp': '2012-04-25T21:49:25.719Z',
+        }
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def make_envelope(self, i: int) -> SNSEnvelope:
+        return SNSEnvelope(dict(self.data, MessageId=str(i)))
+
+    @async_test
+    async def test_write_and_replay(self) -> None:
+        sink = SegmentedFileSink(path=self.path, segment_max_bytes=1024, fsync_batch_size=3)
+        for i in range(20):
+            await sink.write(self.make_envelope(i))
+        await sink.aclose()
+
+        assert len(sink.segments()) > 1
+        assert [message['MessageId'] for message in sink.replay()] == [str(i) for i in range(20)]
+        found = sink.find('7')
+        assert found is not None
+        assert found['Message'] == self.data['Message']
+        assert sink.find('unknown') is None
+
+    @async_test
+    async def test_reopen_after_partial_write(self) -> None:
+        sink = SegmentedFileSink(path=self.path)
+        await sink.write(self.make_envelope(1))
+        await sink.aclose()
+        # Simulate a crash in the middle of a write
+        with (self.path / '0000000000.log').open('ab') as f:
+            f.write(b'{"Type": "Noti')
+
+        sink = SegmentedFileSink(path=self.path)
+        await sink.write(self.make_envelope(2))
+        await sink.aclose()
+        assert [message['MessageId'] for message in sink.replay()] == ['1', '2']
+        assert sink.find('2') is not None
+
+    @async_test
+    async def test_reopen_after_partial_index_write(self) -> None:
+        sink = SegmentedFileSink(path=self.path)
+        await sink.write(self.make_envelope(1))
+        await sink.aclose()
+        # Simulate a crash in the middle of a write, after the record but before its full index line
+        record_size = (self.path / '0000000000.log').stat().st_size
+        with (self.path / '0000000000.log').open('ab') as f:
+            f.write(b'{"Type": "Noti')
+        with (self.path / '0000000000.idx').open('ab') as f:
+            f.write(f'3\t{record_size}'[:-1].encode())
+
+        sink = SegmentedFileSink(path=self.path)
+        await sink.write(self.make_envelope(2))
+        await sink.aclose()
+        assert sink.read_index(0)['2'] == record_size + len(b'{"Type": "Noti\n')
+        assert sink.find('2') is not None
+        assert sink.find('3') is None
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+from sns_monitor.topics import TopicAllowList
+
+__author__ = 'lundberg'
+
+
+class TestTopicAllowList(TestCase):
+    def test_contains(self):
+        allow_list = TopicAllowList(
+            [
+                'arn:aws:sns:us-west-2:123456789012:MyTopic',
+                'arn:aws:sns:*:210987654321:*',
+                'arn:aws:sns:eu-west-1:123456789012:prod-*',
+            ]
+        )
+        assert 'arn:aws:sns:us-west-2:123456789012:MyTopic' in allow_list
+        assert 'arn:aws:sns:us-east-1:123456789012:MyTopic' not in allow_list
+        assert 'arn:aws:sns:ap-south-1:210987654321:AnyTopic' in allow_list
+        assert 'arn:aws:sns:eu-west-1:123456789012:prod-events' in allow_list
+        assert 'arn:aws:sns:eu-west-1:123456789012:staging-events' not in allow_list
+        # Patterns match the whole ARN
+        assert 'arn:aws:sns:eu-west-1:123456789012:MyTopic' not in allow_list
+
+    def test_empty(self):
+        allow_list = TopicAllowList([])
+        assert not allow_list
+        assert 'arn:aws:sns:us-west-2:123456789012:MyTopic' not in allow_list
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from typing import List
+from unittest import TestCase
+
+from sns_monitor.models import SNSEnvelope
+from sns_monitor.tests.utils import async_test
+from sns_monitor.workers import MessageWorkQueue
+
+__author__ = 'lundberg'
+
+
+class TestMessageWorkQueue(TestCase):
+    def setUp(self) -> None:
+        self.handled: List[str] = []
+        self.release = asyncio.Event()
+
+    @staticmethod
+    def make_envelope(message_id: str) -> SNSEnvelope:
+        return SNSEnvelope(
+            {
+                'Type': 'Notification',
+                'MessageId': message_id,
+                'TopicArn': 'arn:aws:sns:us-west-2:123456789012:MyTopic',
+                'Message': 'test message',
+            }
+        )
+
+    async def handler(self, message: SNSEnvelope) -> None:
+        await self.release.wait()
+        if message.message_id == 'fail':
+            raise RuntimeError('handler failed')
+        self.handled.append(message.message_id)
+
+    @async_test
+    async def test_handle_messages(self) -> None:
+        work_queue = MessageWorkQueue(handler=self.handler, max_size=10, workers=2)
+        for message_id in ['1', 'fail', '2', '3']:
+            assert work_queue.submit(self.make_envelope(message_id)) is True
+        self.release.set()
+        await work_queue.aclose()
+        assert sorted(self.handled) == ['1', '2', '3']
+
+    @async_test
+    async def test_queue_full(self) -> None:
+        work_queue = MessageWorkQueue(handler=self.handler, max_size=2, workers=1)
+        results = [work_queue.submit(self.make_envelope(str(i))) for i in range(3)]
+        assert results == [True, True, False]
+        assert work_queue.full() is True
+        # The worker takes one message off the queue making room for one more
+        await asyncio.sleep(0)
+        assert work_queue.submit(self.make_envelope('3')) is True
+        assert work_queue.submit(self.make_envelope('4')) is False
+        self.release.set()
+        await work_queue.aclose()
+        assert self.handled == ['0', '1', '3']
+
+    @async_test
+    async def test_drain_timeout(self) -> None:
+        work_queue = MessageWorkQueue(handler=self.handler, max_size=2, workers=1, drain_seconds=0.01)
+        work_queue.submit(self.make_envelope('1'))
+        await work_queue.aclose()
+        assert self.handled == []
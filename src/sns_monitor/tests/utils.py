@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional
+
+__author__ = 'lundberg'
+
+
+class MockResponse:
+    def __init__(self, content: bytes = b'', json_data: Optional[dict] = None, status_code: int = 200):
+        self._content = content
+        self._json_data = json_data
+        self._status_code = status_code
+
+    @property
+    def content(self):
+        return self._content
+
+    @property
+    def json(self):
+        return self._json_data
+
+    def raise_for_status(self):
+        pass
+
+
+def async_return(value: Any = None) -> Callable[..., Awaitable[Any]]:
+    """ Coroutine function returning value, as side_effect it makes a MagicMock awaitable (AsyncMock needs 3.8). """
+
+    async def coroutine(*args: Any, **kwargs: Any) -> Any:
+        return value
+
+    return coroutine
+
+
+def async_test(func: Callable[..., Awaitable[Any]]) -> Callable[..., Any]:
+    """ Run an async test method on the event loop (IsolatedAsyncioTestCase needs 3.8). """
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return asyncio.get_event_loop().run_until_complete(func(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Per request timing of the stages of receiving a message.
+
+Stages are recorded in a RequestTimings put in request.state.timings by VerifySNSMessageSignature. The timings are
+returned in a Server-Timing header and/or handed to listeners, for example a tracer turning them into spans, when
+the request is done. When timing is disabled the shared NULL_TIMINGS, that records nothing, is used instead.
+"""
+import logging
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Iterator, List, NamedTuple
+
+from starlette.types import Scope
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+class Span(NamedTuple):
+    name: str
+    # time.perf_counter() at the start of the stage
+    start: float
+    duration: float
+
+
+TimingListener = Callable[[Scope, List[Span]], None]
+
+
+class RequestTimings:
+    __slots__ = ('spans',)
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield None
+        finally:
+            self.spans.append(Span(name, start, time.perf_counter() - start))
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return self._stage(name)
+
+    def server_timing(self) -> str:
+        return ', '.join(f'{span.name};dur={span.duration * 1000:.3f}' for span in self.spans)
+
+
+class NullTimings(RequestTimings):
+    """ Records nothing. """
+
+    _null_context: ContextManager[None] = nullcontext()
+
+    def stage(self, name: str) -> ContextManager[None]:
+        return self._null_context
+
+
+NULL_TIMINGS = NullTimings()
+
+
+class RequestTimer:
+    """ Hands out RequestTimings if the Server-Timing header is enabled or anyone listens for the timings. """
+
+    def __init__(self, server_timing_header: bool = False):
+        self.server_timing_header = server_timing_header
+        self.listeners: List[TimingListener] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.server_timing_header or bool(self.listeners)
+
+    def add_listener(self, listener: TimingListener) -> None:
+        """ Call listener with the ASGI scope and the recorded spans when a request is done. """
+        self.listeners.append(listener)
+
+    def new_timings(self) -> RequestTimings:
+        if self.enabled:
+            return RequestTimings()
+        return NULL_TIMINGS
+
+    def finish(self, scope: Scope, timings: RequestTimings) -> None:
+        for listener in self.listeners:
+            try:
+                listener(scope, timings.spans)
+            except Exception:
+                logger.exception(f'Timing listener {listener} failed')
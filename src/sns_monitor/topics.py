@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import re
+from fnmatch import translate
+from typing import Optional, Pattern, Sequence
+
+__author__ = 'lundberg'
+
+WILDCARD_CHARACTERS = '*?['
+
+
+def is_pattern(topic_arn: str) -> bool:
+    return any(c in topic_arn for c in WILDCARD_CHARACTERS)
+
+
+class TopicAllowList:
+    """
+    Topic ARNs and ARN patterns compiled for constant time lookups.
+
+    Patterns use shell style wildcards, for example arn:aws:sns:*:123456789012:* for all topics in an account or
+    arn:aws:sns:eu-west-1:123456789012:prod-* for a topic prefix. Exact ARNs are kept in a frozenset and all patterns
+    are combined into a single regex.
+    """
+
+    def __init__(self, topic_arns: Sequence[str]):
+        # Kept to tell if the configured list has been replaced
+        self.topic_arns = topic_arns
+        self._exact = frozenset(arn for arn in topic_arns if not is_pattern(arn))
+        patterns = [translate(arn) for arn in topic_arns if is_pattern(arn)]
+        self._pattern: Optional[Pattern] = re.compile('|'.join(patterns)) if patterns else None
+
+    def __bool__(self) -> bool:
+        return bool(self.topic_arns)
+
+    def __contains__(self, topic_arn: str) -> bool:
+        if topic_arn in self._exact:
+            return True
+        return self._pattern is not None and self._pattern.match(topic_arn) is not None
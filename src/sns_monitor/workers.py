@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from typing import List, Optional
+
+from sns_monitor.handlers import MessageHandler
+from sns_monitor.models import SNSEnvelope
+
+__author__ = 'lundberg'
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWorkQueue:
+    """
+    Bounded in-process queue of verified messages handled by a pool of worker tasks.
+
+    Used to acknowledge messages as soon as they are verified instead of after the handlers have run.
+    """
+
+    def __init__(self, handler: MessageHandler, max_size: int = 1000, workers: int = 4, drain_seconds: float = 10.0):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.drain_seconds = drain_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created on first use so that the queue and workers are bound to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        return self._queue
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def submit(self, message: SNSEnvelope) -> bool:
+        """ Queue a message for handling, returns False if the queue is full. """
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _worker(self) -> None:
+        queue = self.queue
+        while True:
+            message = await queue.get()
+            try:
+                await self.handler(message)
+            except asyncio.CancelledError:
+                # A subclass of Exception before Python 3.8
+                raise
+            except Exception:
+                logger.exception(f'Failed to handle message {message.message_id}')
+            finally:
+                queue.task_done()
+
+    async def aclose(self) -> None:
+        if self._queue is None:
+            return None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f'Shutting down with {self._queue.qsize()} unhandled messages in the work queue')
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None